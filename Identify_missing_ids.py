@@ -1,22 +1,28 @@
 import pandas as pd
+from metadata_cache import load_table  # Cached loading of the metadata exports
+from table_join import hash_join  # Inner join and anti-joins in one pass
 
-# Load data from CSV and Excel files
-ids = pd.read_csv('All_SEQ_studo.csv', sep = ',')  # Load sequence data from a CSV file
-banco = pd.read_excel('BANCO-BIOINFO_PILOTO_LABMOVEL_DELTA-OMICRON_SEM-VACINA_vs_COMPLETO_27-01-2023.xlsx')  # Load additional metadata from an Excel file
+# Load data from CSV and Excel files (from the metadata cache if unchanged)
+ids = load_table('All_SEQ_studo.csv', sep = ',')  # Load sequence data from a CSV file
+banco = load_table('BANCO-BIOINFO_PILOTO_LABMOVEL_DELTA-OMICRON_SEM-VACINA_vs_COMPLETO_27-01-2023.xlsx')  # Load additional metadata from an Excel file
 
-# Merge the two datasets based on common columns
-result = pd.merge(ids, banco, how="inner", left_on='IDENTIFICADOR', right_on='hashcode')
-# Perform an inner join to combine rows where 'IDENTIFICADOR' in 'ids' matches 'hashcode' in 'banco'
-
-# Identify missing samples
-# Merge with how="left" to keep all rows from 'ids'
-result_left = pd.merge(ids, banco, how="left", left_on='IDENTIFICADOR', right_on='hashcode')
-
-# Filter rows where there was no match (i.e., 'hashcode' is NaN)
-amostras_sem_match = result_left[result_left['hashcode'].isna()]
+# Join the two datasets based on common columns, in a single pass
+result, amostras_sem_match, banco_sem_uso = hash_join(ids, banco, left_on='IDENTIFICADOR', right_on='hashcode')
+# 'result' holds the rows where 'IDENTIFICADOR' in 'ids' matches 'hashcode' in 'banco' (as an inner merge),
+# 'amostras_sem_match' the study IDs without a match and 'banco_sem_uso' the 'banco' rows no study ID uses
 
 # Display samples with no match
 print(amostras_sem_match[['IDENTIFICADOR']])
 
-# Save the merged result to a CSV file
+# Count the rows of every category
+resumo = pd.DataFrame({
+    'Categoria': ['IDs do estudo', 'IDs com match', 'IDs sem match', 'Linhas do banco', 'Linhas do banco usadas', 'Linhas do banco sem uso', 'Linhas no resultado'],
+    'Total': [len(ids), len(ids) - len(amostras_sem_match), len(amostras_sem_match), len(banco), len(banco) - len(banco_sem_uso), len(banco_sem_uso), len(result)],
+})
+print(resumo.to_string(index=False))
+
+# Save the merged result, the unmatched IDs, the unused metadata rows and the counts to CSV files
 result.to_csv('METADADOS_SEQ_SELECIONADOS_PARA_ESTUDO.csv', index = False, sep = ',')
+amostras_sem_match[['IDENTIFICADOR']].to_csv('IDS_SEM_MATCH.csv', index = False, sep = ',')
+banco_sem_uso.to_csv('BANCO_SEM_USO.csv', index = False, sep = ',')
+resumo.to_csv('RESUMO_MATCH.csv', index = False, sep = ',')
@@ -0,0 +1,89 @@
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from gisaid_fasta import build_header_index, isolate_id_from_header
+
+
+def make_metadata(n_selected, n_headers, seed=1):
+    """Build a final_df-like DataFrame of 'n_selected' isolates drawn from 'n_headers' IDs."""
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(n_headers, size=n_selected, replace=False)
+    return pd.DataFrame({
+        'Isolate_Id': [f'EPI_ISL_{i}' for i in ids],
+        'Collection_Date': pd.to_datetime('2020-01-01') + pd.to_timedelta(rng.integers(0, 1800, n_selected), unit='D'),
+        'Continent': rng.choice(['South America', 'Europe', 'Asia'], n_selected),
+        'Country': rng.choice(['Brazil', 'Chile', 'France'], n_selected),
+        'State': rng.choice(['Sao Paulo', 'Bahia', None], n_selected),
+    })
+
+
+def legacy_relabel(final_df, isolate_id):
+    """The original per-record DataFrame scan, kept here as the baseline."""
+    row = final_df[final_df['Isolate_Id'] == isolate_id]
+    if row.empty:
+        return None
+    collection_date = row['Collection_Date'].iloc[0].strftime('%Y-%m-%d')
+    continent = row['Continent'].iloc[0]
+    country = row['Country'].iloc[0]
+    state = row['State'].iloc[0]
+    return f"{isolate_id}|flu|ha|{isolate_id}|{collection_date}|{continent}|{country}|{state}"
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Regression benchmark for FASTA header relabelling', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--headers', type=int, help='Number of FASTA headers to relabel', default=1_000_000)
+    parser.add_argument('--selected', type=int, help='Number of selected metadata rows', default=10_000)
+    parser.add_argument('--legacy-sample', type=int, help='Headers timed with the legacy scan (extrapolated)', default=500)
+    parser.add_argument('--max-seconds', type=float, help='Fail if relabelling all headers takes longer', default=5.0)
+    args = parser.parse_args()
+
+    final_df = make_metadata(args.selected, args.headers)
+    headers = [f'A/Brazil/{i}/2024|EPI_ISL_{i}|HA|2024-01-01' for i in range(args.headers)]
+    selected_ids = final_df['Isolate_Id'].unique()
+
+    # Hashed lookup: build the index once, then one set test and one dict lookup per header
+    start = time.perf_counter()
+    header_index = build_header_index(final_df)
+    selected_set = set(selected_ids)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    selected = renamed = 0
+    for header in headers:
+        isolate_id = isolate_id_from_header(header)
+        if isolate_id in selected_set:
+            selected += 1
+        if header_index.get(isolate_id) is not None:
+            renamed += 1
+    lookup_time = time.perf_counter() - start
+
+    # Baseline: boolean DataFrame scan and NumPy 'in' on a sample of the headers
+    sample = headers[:: max(1, args.headers // args.legacy_sample)][:args.legacy_sample]
+    start = time.perf_counter()
+    for header in sample:
+        isolate_id = isolate_id_from_header(header)
+        isolate_id in selected_ids
+        legacy_relabel(final_df, isolate_id)
+    legacy_time = (time.perf_counter() - start) / len(sample) * args.headers
+
+    # Both approaches must build the same headers
+    for isolate_id in selected_ids[:args.legacy_sample]:
+        assert header_index[isolate_id] == legacy_relabel(final_df, isolate_id)
+
+    total = build_time + lookup_time
+    print(f"{args.headers} headers, {args.selected} selected rows ({selected} selected, {renamed} relabelled)")
+    print(f"hashed index:  {total:8.2f} s (build {build_time:.2f} s, lookups {lookup_time:.2f} s)")
+    print(f"legacy scan:   {legacy_time:8.0f} s (extrapolated from {len(sample)} headers)")
+    print(f"speed-up:      {legacy_time / total:8.0f}x")
+
+    if total > args.max_seconds:
+        print(f"FAIL: relabelling took {total:.2f} s, more than {args.max_seconds} s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from metadata_cache import load_metadata
+
+# Columns the GISAID subsampling script actually uses
+COLUMNS = ['Isolate_Id', 'Collection_Date', 'Location']
+
+
+def make_exports(directory, n_files, rows, seed=1):
+    """Write 'n_files' synthetic EpiFlu-like .xlsx exports of 'rows' rows each."""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for number in range(n_files):
+        df = pd.DataFrame({
+            'Isolate_Id': [f'EPI_ISL_{number * rows + i}' for i in range(rows)],
+            'Isolate_Name': [f'A/Bahia/{number * rows + i}/2023' for i in range(rows)],
+            'Subtype': 'A / H3N2',
+            'Lineage': rng.choice(['3C.2a1b.2a.2', '3C.2a1b.2a.1'], rows),
+            'Collection_Date': pd.to_datetime('2020-01-01') + pd.to_timedelta(rng.integers(0, 1800, rows), unit='D'),
+            'Location': rng.choice(['South America / Brazil / Bahia', 'Europe / France / Paris'], rows),
+            'Submitting_Lab': 'LACEN-BA',
+        })
+        path = os.path.join(directory, f'export_{number}.xlsx')
+        df.to_excel(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Wall time of the metadata loader by number of workers', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--files', type=int, help='Number of Excel exports', default=50)
+    parser.add_argument('--rows', type=int, help='Rows per export', default=5000)
+    parser.add_argument('--workers', type=int, nargs='+', help='Worker counts to time', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_exports(tmp, args.files, args.rows)
+        print(f"{args.files} exports of {args.rows} rows")
+
+        # Baseline: the original list comprehension reading every column
+        start = time.perf_counter()
+        baseline = pd.concat([pd.read_excel(path) for path in paths], ignore_index=True)[COLUMNS]
+        print(f"pd.read_excel loop:      {time.perf_counter() - start:7.2f} s")
+
+        for workers in args.workers:
+            # A fresh cache directory so every file is parsed
+            cache_dir = tempfile.mkdtemp(dir=tmp)
+            start = time.perf_counter()
+            combined_df = load_metadata(paths, cache_dir=cache_dir, workers=workers, usecols=COLUMNS)
+            print(f"load_metadata {workers:2d} workers: {time.perf_counter() - start:7.2f} s")
+            pd.testing.assert_frame_equal(combined_df, baseline)
+
+        # Second run on the last cache: every file comes from the cache
+        start = time.perf_counter()
+        load_metadata(paths, cache_dir=cache_dir, usecols=COLUMNS)
+        print(f"load_metadata cached:    {time.perf_counter() - start:7.2f} s")
+
+if __name__ == "__main__":
+    main()
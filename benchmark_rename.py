@@ -0,0 +1,95 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from rename import rewrite_headers, load_pattern
+
+
+def legacy_rename(input_path, output_path, pattern):
+    """The original line-by-line loop of rename.py, kept here as the baseline."""
+    with open(input_path) as input_file:
+        output_file = open(output_path, "w")
+        for line in input_file:
+            line = line.rstrip()
+            if line.find(">") != -1:
+                aux = line.split(">")[1]
+                output_file.write(">" + pattern[aux])
+            else:
+                output_file.write(line)
+            output_file.write("\n")
+        output_file.close()
+
+
+def make_fasta(path, list_path, size_mb, seq_length=30000, line_width=60, newline="\n"):
+    """Write a synthetic GISAID-like FASTA of about 'size_mb' megabytes (lines ending in 'newline') and its rename list."""
+    rng = random.Random(1)
+    bases = "ACGT"
+    # Reuse a handful of sequences so building the file stays fast
+    sequences = []
+    for _ in range(16):
+        seq = "".join(rng.choice(bases) for _ in range(seq_length))
+        sequences.append("\n".join(seq[i:i + line_width] for i in range(0, seq_length, line_width)) + "\n")
+
+    written = 0
+    n = 0
+    with open(path, "w", newline=newline) as fasta, open(list_path, "w") as mapping:
+        while written < size_mb * 1024 * 1024:
+            header = f"hCoV-19/Brazil/SP-{n}/2024|EPI_ISL_{10000000 + n}|2024-01-{n % 28 + 1:02d}"
+            record = f">{header}\n{sequences[n % len(sequences)]}"
+            fasta.write(record)
+            mapping.write(f"{header}\tEPI_ISL_{10000000 + n}\n")
+            written += len(record)
+            n += 1
+    return n
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Throughput benchmark for rename.py', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--size-mb', type=int, help='Size of the synthetic FASTA in MB', default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fasta_path = os.path.join(tmp, "input.fasta")
+        list_path = os.path.join(tmp, "list.tsv")
+        legacy_path = os.path.join(tmp, "legacy.fasta")
+        streaming_path = os.path.join(tmp, "streaming.fasta")
+
+        n = make_fasta(fasta_path, list_path, args.size_mb)
+        size_mb = os.path.getsize(fasta_path) / (1024 * 1024)
+        print(f"Synthetic FASTA: {n} records, {size_mb:.1f} MB")
+
+        # Baseline: the original line-by-line loop
+        pattern = {k.decode(): v.decode() for k, v in load_pattern(list_path).items()}
+        start = time.perf_counter()
+        legacy_rename(fasta_path, legacy_path, pattern)
+        legacy_time = time.perf_counter() - start
+
+        # Streaming block rewrite
+        pattern = load_pattern(list_path)
+        start = time.perf_counter()
+        with open(fasta_path, "rb") as input_file, open(streaming_path, "wb") as output_file:
+            rewrite_headers(input_file, output_file, pattern)
+        streaming_time = time.perf_counter() - start
+
+        # Both approaches must produce the same file
+        with open(legacy_path, "rb") as a, open(streaming_path, "rb") as b:
+            assert a.read() == b.read(), "streaming output differs from the legacy loop"
+
+        # Same check on a small CRLF file, with blocks that split lines and CRLF pairs
+        make_fasta(fasta_path, list_path, 1, newline="\r\n")
+        legacy_rename(fasta_path, legacy_path, {k.decode(): v.decode() for k, v in load_pattern(list_path).items()})
+        for block_size in (4093, 65536):
+            with open(fasta_path, "rb") as input_file, open(streaming_path, "wb") as output_file:
+                rewrite_headers(input_file, output_file, load_pattern(list_path), block_size=block_size)
+            with open(legacy_path, "rb") as a, open(streaming_path, "rb") as b:
+                assert a.read() == b.read(), "streaming output differs from the legacy loop on CRLF input"
+
+    print(f"legacy loop:     {size_mb / legacy_time:8.1f} MB/s ({legacy_time:.2f} s)")
+    print(f"streaming blocks: {size_mb / streaming_time:8.1f} MB/s ({streaming_time:.2f} s)")
+    print(f"speed-up:         {legacy_time / streaming_time:8.1f}x")
+
+if __name__ == "__main__":
+    main()
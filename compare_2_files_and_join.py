@@ -1,12 +1,124 @@
 # Import the Pandas library for data manipulation
+import os
+import pickle
+import argparse
+import tempfile
+
+import numpy as np
 import pandas as pd
 
-# Load the Excel and CSV files into dataframes
-df1 = pd.read_excel('file.xls', sheet_name='sheet1')  # Load the 'sheet1' sheet from the Excel file
-df2 = pd.read_csv('file.csv', sep=',')  # Load the CSV file using a comma as the delimiter
+from table_join import join_indices
+
+
+def join_in_memory(df1, right_path, left_on, right_on, output_path):
+    """Left merge with the whole CSV loaded in memory, the original behaviour."""
+    df2 = pd.read_csv(right_path, sep=',')  # Load the CSV file using a comma as the delimiter
+
+    # Perform a left merge on 'ID' from df1 and 'ID2' from df2
+    result = pd.merge(df1, df2, how="left", left_on=left_on, right_on=right_on)
+
+    # Save the resulting merged dataframe as a TSV file
+    result.to_csv(output_path, index=False, sep='\t')
+
+
+def join_chunked(df1, right_path, left_on, right_on, output_path, chunksize=1_000_000, spill_dir=None):
+    """
+    Left merge that streams the CSV in chunks instead of loading it whole.
+
+    'df1' (the spreadsheet, the small side) is split into blocks of 'chunksize' rows and
+    a hash index is built once on its keys. Every CSV chunk is probed against it and
+    its matching rows are spilled to a temporary file per block of 'df1' that holds
+    their key, then dropped. Each block is finally merged with its own spilled rows
+    and written, so memory holds 'df1', one CSV chunk and one block with its matches,
+    whatever the size of the CSV or the number of matches overall. Rows, order and
+    number formatting are the same as join_in_memory's.
+
+    Parameters:
+    df1: Left table, already loaded.
+    right_path: CSV file to stream.
+    left_on: Key column of df1.
+    right_on: Key column of the CSV.
+    output_path: TSV file written block by block.
+    chunksize: Rows read from the CSV, and rows of df1 per output block; bounds the memory.
+    spill_dir: Directory for the temporary files (the system default when None).
+    """
+    # Hash index on the keys of the small side (missing keys included: pd.merge pairs NaN with NaN)
+    keys = pd.Index(df1[left_on].unique())
+    left_codes = keys.get_indexer(df1[left_on])
+    blocks = np.arange(len(df1)) // chunksize
+    n_blocks = int(blocks[-1]) + 1 if len(df1) else 1
+
+    # Every (key, block of df1) pair, for routing the matching CSV rows to the blocks that need them
+    routes = pd.DataFrame({'key': left_codes, 'block': blocks}).drop_duplicates()
+    found = np.zeros(len(keys), dtype=bool)
+
+    with tempfile.TemporaryDirectory(dir=spill_dir) as tmp_dir:
+        spill_paths = [os.path.join(tmp_dir, f'block-{block}.pkl') for block in range(n_blocks)]
+        columns = None
+        for chunk in pd.read_csv(right_path, sep=',', chunksize=chunksize):
+            # The empty slices keep the dtype of every chunk, so the dtypes of the matching rows
+            # are promoted like those of the whole file read at once
+            columns = chunk.iloc[:0] if columns is None else pd.concat([columns, chunk.iloc[:0]])
+            codes = keys.get_indexer(chunk[right_on])
+            found[codes[codes >= 0]] = True
+
+            rows, route_rows, _, _ = join_indices(codes[codes >= 0], routes['key'].to_numpy())
+            matches = chunk[codes >= 0]
+            route_blocks = routes['block'].to_numpy()[route_rows]
+            for block in np.unique(route_blocks):
+                with open(spill_paths[block], 'ab') as spill_file:
+                    pickle.dump(matches.iloc[rows[route_blocks == block]], spill_file)
+
+        # The in-memory merge fills the left rows without a match with NaN, which turns integer
+        # columns of df2 into floats for the whole output; apply the same promotion up front so
+        # every block is written with the dtypes of the full merge
+        if columns is None:
+            columns = pd.read_csv(right_path, sep=',', nrows=0)
+        if not found[left_codes].all():
+            columns = columns.reindex(range(1)).iloc[:0]
+        dtypes = columns.dtypes.to_dict()
+
+        for block in range(n_blocks):
+            df2 = pd.concat([columns] + list(_read_spill(spill_paths[block])), ignore_index=True).astype(dtypes)
+            rows = slice(block * chunksize, (block + 1) * chunksize)
+            result = pd.merge(df1.iloc[rows], df2, how="left", left_on=left_on, right_on=right_on)
+            result.to_csv(output_path, index=False, sep='\t', mode='w' if block == 0 else 'a', header=block == 0)
+            del df2, result
+
+
+def _read_spill(path):
+    """Yield the blocks of rows pickled one after the other into a spill file (none if it does not exist)."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as spill_file:
+        while True:
+            try:
+                yield pickle.load(spill_file)
+            except EOFError:
+                return
+
+
+def main():
+
+    # Set up the argument parser with a description and default formatting
+    parser = argparse.ArgumentParser(description='Left join of an Excel sheet with a CSV file', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--excel', type=str, help='Excel file (left side)', default='file.xls')
+    parser.add_argument('--sheet', type=str, help='Sheet of the Excel file', default='sheet1')
+    parser.add_argument('--csv', type=str, help='CSV file (right side)', default='file.csv')
+    parser.add_argument('--left-on', type=str, help='Key column of the Excel sheet', default='ID')
+    parser.add_argument('--right-on', type=str, help='Key column of the CSV file', default='ID2')
+    parser.add_argument('--output', type=str, help='Output TSV file', default='result.tsv')
+    parser.add_argument('--chunksize', type=int, help='Stream the CSV in chunks of this many rows (out-of-core join) instead of loading it whole', default=None)
+    parser.add_argument('--spill-dir', type=str, help='Directory for the temporary files of the chunked join', default=None)
+    args = parser.parse_args()
+
+    # Load the Excel file into a dataframe
+    df1 = pd.read_excel(args.excel, sheet_name=args.sheet)  # Load the 'sheet1' sheet from the Excel file
 
-# Perform a left merge on 'ID' from df1 and 'ID2' from df2
-result = pd.merge(df1, df2, how="left", left_on='ID', right_on='ID2')
+    if args.chunksize:
+        join_chunked(df1, args.csv, args.left_on, args.right_on, args.output, chunksize=args.chunksize, spill_dir=args.spill_dir)
+    else:
+        join_in_memory(df1, args.csv, args.left_on, args.right_on, args.output)
 
-# Save the resulting merged dataframe as a TSV file
-result.to_csv('result.tsv', index=False, sep='\t')
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+# Files of a count store directory
+COUNTS_FILE = 'counts-{version}.npy'  # int64 array (regions x periods x lineages), memory-mapped
+CATEGORIES_FILE = 'categories.json'  # Category dictionaries, time axis, applied batches and current counts file
+JOURNAL_FILE = 'journal.npz'  # Previous values of the cells an in-place update is changing
+
+
+class CountStore:
+    """
+    Persisted sequence counts by region, period and lineage, updated batch by batch.
+
+    The counts live in a memory-mapped .npy file; the region and lineage names are
+    append-only dictionaries (name -> position) and the time axis is a range of period
+    ordinals, so adding a batch only touches the cells of its own rows. The array is
+    allocated with spare room and reallocated only when a new region, lineage or period
+    does not fit, doubling just the dimension that ran out. Region slot 0 holds the rows
+    without a region.
+
+    Every batch can carry an identifier (e.g. its file name); a batch whose identifier
+    was already applied is skipped, so re-running a weekly update does not count the
+    same sequences twice.
+
+    Updates are crash-safe. categories.json, which names the current counts file together
+    with the batch identifiers and the time axis, is replaced in one atomic step that
+    commits the update. A batch that fits is added in place after the previous values
+    of the cells it touches are saved to a journal; if the process stops before the
+    commit, the next open puts those values back. A batch that needs a reallocation is
+    written to a new counts file, and the previous one stays untouched until the commit.
+    """
+
+    def __init__(self, path, freq='M'):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        categories_path = os.path.join(path, CATEGORIES_FILE)
+        if os.path.exists(categories_path):
+            with open(categories_path) as categories_file:
+                self.meta = json.load(categories_file)
+            self.meta.setdefault('generation', 0)
+        else:
+            self.meta = {'freq': freq, 'first_period': None, 'periods': 0, 'regions': [None], 'lineages': [], 'batches': [], 'version': None, 'generation': 0}
+        self.counts = None
+        if self.meta['version'] is not None:
+            self.counts = open_memmap(self._counts_path(self.meta['version']), mode='r+')
+        self._recover()
+        self.freq = self.meta['freq']
+        self._region_codes = {name: code for code, name in enumerate(self.meta['regions'])}
+        self._lineage_codes = {name: code for code, name in enumerate(self.meta['lineages'])}
+
+    def _counts_path(self, version):
+        return os.path.join(self.path, COUNTS_FILE.format(version=version))
+
+    def _recover(self):
+        """Undo an in-place update that was not committed and delete the files an interrupted or finished update left behind."""
+        journal_path = os.path.join(self.path, JOURNAL_FILE)
+        if os.path.exists(journal_path):
+            with np.load(journal_path) as journal:
+                # The journal was written against the generation it would have committed over
+                if int(journal['generation']) == self.meta['generation'] and self.counts is not None:
+                    self.counts.reshape(-1)[journal['cells']] = journal['before']
+                    self.counts.flush()
+            os.remove(journal_path)
+
+        current = COUNTS_FILE.format(version=self.meta['version'])
+        for name in os.listdir(self.path):
+            if name.startswith('counts-') and name.endswith('.npy') and name != current:
+                os.remove(os.path.join(self.path, name))
+
+    def _codes(self, values, names, codes):
+        """Map a column to store codes, registering the new names; missing values give -1."""
+        value_codes, uniques = pd.factorize(values)
+        mapping = np.empty(len(uniques) + 1, dtype=np.int64)
+        mapping[-1] = -1  # Missing values (code -1) map to -1
+        for number, name in enumerate(uniques.tolist()):
+            name = str(name)
+            if name not in codes:
+                codes[name] = len(names)
+                names.append(name)
+            mapping[number] = codes[name]
+        return mapping[value_codes]
+
+    def _fit(self, used, first_period, last_period):
+        """
+        Extend the time axis to the periods first..last and make sure the array has room
+        for all categories ('used' is the used shape so far). Returns the array to update,
+        which is a new, reallocated counts file when the current one is too small.
+        """
+        meta = self.meta
+        old_first = meta['first_period'] if meta['first_period'] is not None else first_period
+        new_first = min(old_first, first_period)
+        periods = max(old_first + meta['periods'], last_period + 1) - new_first
+        needed = (len(meta['regions']), periods, len(meta['lineages']))
+        meta['first_period'], meta['periods'] = new_first, periods
+
+        capacity = self.counts.shape if self.counts is not None else (0, 0, 0)
+        if new_first == old_first and all(n <= c for n, c in zip(needed, capacity)):
+            return self.counts
+
+        # Reallocate (also when the time axis starts earlier), doubling only the dimensions
+        # that ran out, and move the old counts to their new period offset
+        shape = tuple(max(n, 2 * c) if n > c else c for n, c in zip(needed, capacity))
+        version = 0 if meta['version'] is None else meta['version'] + 1
+        counts = open_memmap(self._counts_path(version), mode='w+', dtype=np.int64, shape=shape)
+        if self.counts is not None:
+            shift = old_first - new_first
+            counts[:used[0], shift:shift + used[1], :used[2]] = self.counts[:used[0], :used[1], :used[2]]
+        meta['version'] = version
+        return counts
+
+    def add(self, df, date, lineage, region=None, batch_id=None):
+        """
+        Add the rows of a metadata batch to the counts.
+
+        Parameters:
+        df: Metadata with one row per sequence.
+        date: Column with the collection date.
+        lineage: Column with the lineage or clade.
+        region: Optional column with the region.
+        batch_id: Identifier of the batch; a batch already applied is skipped.
+
+        Returns:
+        Number of rows counted (0 if the batch was skipped).
+        """
+        if batch_id is not None and batch_id in self.meta['batches']:
+            return 0
+
+        used = (len(self.meta['regions']), self.meta['periods'], len(self.meta['lineages']))
+        periods = pd.to_datetime(df[date]).dt.to_period(self.freq)
+        period_codes = periods.array.asi8
+        lineage_codes = self._codes(df[lineage], self.meta['lineages'], self._lineage_codes)
+        if region is None:
+            region_codes = np.zeros(len(df), dtype=np.int64)
+        else:
+            region_codes = self._codes(df[region], self.meta['regions'], self._region_codes)
+            region_codes[region_codes < 0] = 0
+
+        # Rows without a date or lineage are not counted (as groupby does)
+        valid = periods.notna().to_numpy() & (lineage_codes >= 0)
+        counts = None
+        if valid.any():
+            counts = self._fit(used, int(period_codes[valid].min()), int(period_codes[valid].max()))
+            cells = np.ravel_multi_index((region_codes[valid], period_codes[valid] - self.meta['first_period'], lineage_codes[valid]), counts.shape)
+            cells, increments = np.unique(cells, return_counts=True)
+            flat = counts.reshape(-1)
+            before = flat[cells]
+            if counts is self.counts:
+                # In place: journal the previous values of the touched cells first
+                self._write_journal(cells, before)
+            flat[cells] = before + increments
+            counts.flush()
+
+        # Commit point: the counts, the time axis and the batch id are recorded together
+        if batch_id is not None:
+            self.meta['batches'].append(batch_id)
+        self.meta['generation'] += 1
+        self._save()
+        if counts is not None and counts is not self.counts:
+            del self.counts
+            self.counts = counts
+        self._recover()
+        return int(valid.sum())
+
+    def _write_journal(self, cells, before):
+        tmp_path = os.path.join(self.path, JOURNAL_FILE + '.tmp')
+        with open(tmp_path, 'wb') as journal_file:
+            np.savez(journal_file, generation=self.meta['generation'], cells=cells, before=before)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(tmp_path, os.path.join(self.path, JOURNAL_FILE))
+
+    def _save(self):
+        tmp_path = os.path.join(self.path, CATEGORIES_FILE + '.tmp')
+        with open(tmp_path, 'w') as categories_file:
+            json.dump(self.meta, categories_file)
+            categories_file.flush()
+            os.fsync(categories_file.fileno())
+        os.replace(tmp_path, os.path.join(self.path, CATEGORIES_FILE))
+
+    def cube(self):
+        """
+        Return the counts in the layout of stackplot_data.count_cube.
+
+        Returns:
+        counts: int64 array (len(regions) + 1, len(periods), len(lineages)), the last
+                region slot holding the rows without a region.
+        regions: Sorted region names.
+        periods: PeriodIndex of the periods with data.
+        lineages: Sorted lineage names.
+        """
+        meta = self.meta
+        if self.counts is None or not meta['periods']:
+            return np.zeros((1, 0, 0), dtype=np.int64), pd.Index([]), pd.PeriodIndex([], freq=self.freq), pd.Index([])
+        counts = np.asarray(self.counts[:len(meta['regions']), :meta['periods'], :len(meta['lineages'])])
+
+        regions = pd.Index(meta['regions'][1:])
+        lineages = pd.Index(meta['lineages'])
+        region_order = np.append(np.argsort(regions.to_numpy(dtype=str), kind='stable') + 1, 0)
+        lineage_order = np.argsort(lineages.to_numpy(dtype=str), kind='stable')
+        with_data = counts.sum(axis=(0, 2)) > 0
+        periods = pd.PeriodIndex.from_ordinals(np.arange(meta['first_period'], meta['first_period'] + meta['periods']), freq=self.freq)
+
+        counts = counts[region_order][:, with_data][:, :, lineage_order]
+        return counts, regions[region_order[:-1] - 1], periods[with_data], lineages[lineage_order]
+
+    def frame(self, region=None):
+        """Counts (periods x lineages) as a DataFrame, for one region or for all of them."""
+        counts, regions, periods, lineages = self.cube()
+        table = counts.sum(axis=0) if region is None else counts[regions.get_loc(region)]
+        return pd.DataFrame(table, index=periods, columns=lineages)
+
+
+def main():
+
+    # Set up the argument parser with a description and default formatting
+    parser = argparse.ArgumentParser(description='Add metadata batches to a persisted count store', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--store', type=str, required=True, help='Count store directory')
+    parser.add_argument('--date', type=str, required=True, help='Column with the collection date')
+    parser.add_argument('--lineage', type=str, required=True, help='Column with the lineage or clade')
+    parser.add_argument('--region', type=str, help='Column with the region', default=None)
+    parser.add_argument('--freq', type=str, help="Period of the time axis for a new store ('D' keeps daily counts that stackplot_data.roll_up bins into weeks, months or windows)", default='M')
+    parser.add_argument('--sep', type=str, help='Field separator of the batches', default=',')
+    parser.add_argument('batches', nargs='*', help='CSV files with the new sequences (each is applied once)')
+    args = parser.parse_args()
+
+    store = CountStore(args.store, freq=args.freq)
+    columns = [args.date, args.lineage] + ([args.region] if args.region else [])
+    for path in args.batches:
+        df = pd.read_csv(path, sep=args.sep, usecols=columns)
+        count = store.add(df, args.date, args.lineage, args.region, batch_id=os.path.abspath(path))
+        print(f"{path}: {count} sequences added" if count else f"{path}: already in the store")
+    print(store.frame())
+
+if __name__ == "__main__":
+    main()
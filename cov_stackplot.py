@@ -1,52 +1,10 @@
+import os
+
 import pandas as pd
 import matplotlib.pyplot as plt
-import numpy as np
-
-def complete_dataframe(df1=None, df2=None, with_nonzero=False):
-    """
-    This function ensures that both DataFrames have the same columns and indexes.
-    If a column or index in df1 is missing in df2, it will be added to df2.
-    If with_nonzero is True, missing rows are filled with the previous row's data, otherwise, they are filled with None.
-
-    Parameters:
-    df1: The first DataFrame, serving as the reference.
-    df2: The second DataFrame, which will be completed.
-    with_nonzero: If True, rows missing from df2 will be filled with the previous row's values.
-    
-    Returns:
-    df2: The modified DataFrame, with missing columns and indexes from df1 added and NaNs filled with 0.
-    """
-    
-    # Include columns from df1 in df2 if they don't exist in df2
-    COLUMNS1 = df1.columns
-    COLUMNS2 = df2.columns
-
-    for C1 in COLUMNS1:
-        if C1 not in COLUMNS2:
-            df2[C1] = None  # Add missing columns to df2
-    
-    # Include indexes from df1 in df2 if they don't exist in df2
-    INDEX1 = df1.index
-    INDEX2 = df2.index
-
-    for I1 in INDEX1:
-        if I1 not in INDEX2:
-            if with_nonzero:
-                # If the index is missing, add it and fill it with previous row's data
-                df2.loc[I1] = None
-                df2 = df2.sort_index()
-                Idx = np.where(df2.index == I1)[0][0]
-                if Idx != 0:
-                    df2.loc[I1] = df2.iloc[Idx-1, :]  # Fill missing row with previous row
-                else:
-                    df2.loc[I1] = df2.iloc[Idx+1, :]  # If it's the first row, use the next row
-            else:
-                df2.loc[I1] = None  # If with_nonzero is False, fill with None
-
-    # Sort the index of df2 and fill NaN values with 0
-    df2 = df2.sort_index()
-    df2 = df2.fillna(0)
-    return df2
+from stackplot_data import stream_counts  # Chunked counting of the frequency table
+from count_store import CountStore  # Persisted counts updated with the new batches only
+from pango_lineages import LineageTree  # Collapsing of sublineages into parent groups
 
 # Update the plot settings with custom parameters for better readability
 params = {'legend.fontsize': 14,
@@ -57,40 +15,76 @@ params = {'legend.fontsize': 14,
           'ytick.labelsize': 10}
 plt.rcParams.update(params)
 
-# Load the CSV file containing COVID-19 data from São Paulo
-df = pd.read_csv("cov_SP2024-jan-26-jun.csv", sep=",", index_col=False)
-
-# Filter only the relevant columns (country, date of collection, and clade)
-df = df[['pais', 'collection_date', 'clado']]
-
-# Reset the DataFrame index
-df.reset_index(drop=True, inplace=True)
-
-# Convert the 'collection_date' column to datetime format
-df['collection_date'] = pd.to_datetime(df['collection_date'])
+# Persisted monthly counts (see count_store.py): when COUNT_STORE is set, only the metadata
+# files listed in NEW_BATCHES (e.g. this week's sequences) are read and added to the store,
+# and the figure is drawn from the stored counts instead of re-reading the whole CSV history
+COUNT_STORE = None
+NEW_BATCHES = []
+
+# Streaming mode for national-scale metadata: when CHUNKSIZE is set, only the date and clade
+# columns are read, CHUNKSIZE rows at a time, and reduced to counts by month and clade chunk by
+# chunk, so the whole file is never held in memory
+CHUNKSIZE = None
+
+# When the plotted column holds Pango lineages, collapse them into groups after counting: to the
+# closest ancestor in WATCHLIST (the others go to 'Other'), or else to COLLAPSE_DEPTH numbered
+# levels of the unaliased name ("EG.5.1" -> "XBB.1" with depth 1). ALIAS_FILE is a local copy of
+# pango-designation's alias_key.json, needed to follow the hierarchy across aliases (e.g. KP.2 is
+# a JN.1 sublineage)
+ALIAS_FILE = None
+WATCHLIST = []
+COLLAPSE_DEPTH = None
+
+if COUNT_STORE:
+    store = CountStore(COUNT_STORE)
+    for path in NEW_BATCHES:
+        batch = pd.read_csv(path, sep=",", usecols=['pais', 'collection_date', 'clado'])
+        store.add(batch, 'collection_date', 'clado', region='pais', batch_id=os.path.abspath(path))
+
+    # Counts by month and clade, and occurrences of each clade, from the store
+    df1 = store.frame()
+    contagem_clado = df1.sum().sort_values(ascending=False)
+elif CHUNKSIZE:
+    # Counts by month and clade, and occurrences of each clade, accumulated over the chunks
+    df1, contagem_clado = stream_counts("cov_SP2024-jan-26-jun.csv", 'collection_date', 'clado', chunksize=CHUNKSIZE, sep=",")
+else:
+    # Load the CSV file containing COVID-19 data from São Paulo
+    df = pd.read_csv("cov_SP2024-jan-26-jun.csv", sep=",", index_col=False)
+
+    # Filter only the relevant columns (country, date of collection, and clade)
+    df = df[['pais', 'collection_date', 'clado']]
+
+    # Reset the DataFrame index
+    df.reset_index(drop=True, inplace=True)
+
+    # Convert the 'collection_date' column to datetime format
+    df['collection_date'] = pd.to_datetime(df['collection_date'])
+
+    # Create a list of unique values from the 'pais' column (locations)
+    UPA = list(set(df['pais'].values))
+    UPA = [i for i in UPA if i == i]  # Filter out NaN values
+    UPA.sort()  # Sort the list alphabetically
+
+    # Group the data by month and clade and count occurrences
+    df1 = df[['collection_date', 'clado']]
+    df1['month'] = df1['collection_date'].dt.to_period('M')  # Convert dates to periods by month
+    df1 = df1.groupby(['month', 'clado']).size().unstack(fill_value=0)  # Group by month and clade, fill missing values with 0
+
+    # Count occurrences of each clade in the dataset
+    contagem_clado = df['clado'].value_counts()
+
+# Add up the counts of the lineages of every group (only the distinct names are resolved)
+if WATCHLIST or COLLAPSE_DEPTH is not None:
+    tree = LineageTree.from_file(ALIAS_FILE) if ALIAS_FILE else LineageTree()
+    df1 = tree.collapse_table(df1, depth=COLLAPSE_DEPTH, watchlist=WATCHLIST)
+    contagem_clado = tree.collapse_table(contagem_clado, depth=COLLAPSE_DEPTH, watchlist=WATCHLIST)
+
+# Clades shown in the legend: the columns of the plotted table, the same in every mode
+unique_clades = set(df1.columns)
 
-# Create a list of unique values from the 'pais' column (locations)
-UPA = list(set(df['pais'].values))
-UPA = [i for i in UPA if i == i]  # Filter out NaN values
-UPA.sort()  # Sort the list alphabetically
-
-# Group the data by month and clade and count occurrences
-df1 = df[['collection_date', 'clado']]
-df1['month'] = df1['collection_date'].dt.to_period('M')  # Convert dates to periods by month
-df1 = df1.groupby(['month', 'clado']).size().unstack(fill_value=0)  # Group by month and clade, fill missing values with 0
-
-# Count occurrences of each clade in the dataset
-contagem_clado = df['clado'].value_counts()
 print(contagem_clado)
 
-# Re-group data by month and clade (duplicate of above code, may not be necessary)
-df['collection_date'] = pd.to_datetime(df['collection_date'])
-df1 = df[['collection_date', 'clado']]
-df1['month'] = df1['collection_date'].dt.to_period('M')
-df1 = df1.groupby(['month', 'clado']).size().unstack(fill_value=0)
-
 # Define the colors for each clade in the plot
-unique_clades = set(df['clado'])
 clade_color_dict = {"23I": "#8dd3c7", "recombinant": "#ffffb3", "23A": "#bebada", "23G": "#fb8072", 
                     "23F": "#80b1d3", "23E": "#fdb462", "23H": "#b3de69", "22E": "#fccde5", "21K": "#d9d9d9"}
 
@@ -2,6 +2,16 @@
 import pandas as pd  # For data manipulation and analysis
 import seaborn as sns  # For advanced data visualization and plotting
 import matplotlib.pyplot as plt  # For creating plots and visualizations
+from crosstab import crosstab  # Lineage x clade counts built once, in both orientations
+from pango_lineages import LineageTree  # Collapsing of sublineages into parent groups
+
+# Collapse the Pango lineages before counting: to the closest ancestor in WATCHLIST (the others
+# go to 'Other'), or else to COLLAPSE_DEPTH numbered levels of the unaliased name ("EG.5.1" ->
+# "XBB.1" with depth 1). ALIAS_FILE is a local copy of pango-designation's alias_key.json, needed
+# to follow the hierarchy across aliases (e.g. KP.2 is a JN.1 sublineage)
+ALIAS_FILE = None
+WATCHLIST = []
+COLLAPSE_DEPTH = None
 
 # Load the dataset from a CSV file
 df = pd.read_csv('para_count.csv', sep = ",")  # Read the CSV file into a DataFrame
@@ -9,15 +19,23 @@ df = pd.read_csv('para_count.csv', sep = ",")  # Read the CSV file into a DataFr
 # Display the first few rows of the DataFrame to ensure data is loaded correctly
 print(df.head())
 
-# Group by 'Pangolin_lineage' and 'Clade' and count occurrences
-result = df.groupby(['Pangolin_lineage', 'Clade']).size().reset_index(name='Count')
+# Replace each lineage with its group (every distinct name is resolved only once)
+if WATCHLIST or COLLAPSE_DEPTH is not None:
+    tree = LineageTree.from_file(ALIAS_FILE) if ALIAS_FILE else LineageTree()
+    df['Pangolin_lineage'] = tree.collapse_column(df['Pangolin_lineage'], depth=COLLAPSE_DEPTH, watchlist=WATCHLIST)
+
+# Count every combination of 'Pangolin_lineage' and 'Clade' once (kept sparse when the
+# lineage x clade matrix is very large)
+table = crosstab(df['Pangolin_lineage'], df['Clade'])
+
 # Create a DataFrame with counts of each combination of Pangolin_lineage and Clade
+result = table.long(name='Count')
 
-# Create a pivot table with 'Pangolin_lineage' as columns and 'Clade' as rows, filling missing values with 0
-result2 = df.groupby(['Pangolin_lineage', 'Clade']).size().unstack(fill_value=0)
+# Pivot table with 'Pangolin_lineage' as rows and 'Clade' as columns, filling missing values with 0
+result2 = table.frame()
 
-# Create a pivot table with 'Clade' as columns and 'Pangolin_lineage' as rows, filling missing values with 0
-result3 = df.groupby(['Clade', 'Pangolin_lineage']).size().unstack(fill_value=0)
+# Pivot table with 'Clade' as rows and 'Pangolin_lineage' as columns (the transpose of the same counts)
+result3 = table.T.frame()
 
 # Display the result DataFrames
 print(result)
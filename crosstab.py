@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+# Sparse matrices need scipy; without it every table is kept dense
+try:
+    import scipy.sparse
+    HAVE_SCIPY = True
+except ImportError:
+    HAVE_SCIPY = False
+
+# Above this many cells (rows x columns) a table built with sparse=None is kept sparse
+DENSE_CELLS_LIMIT = 2 ** 24
+
+
+class Crosstab:
+    """
+    Counts of every (row value, column value) pair of two columns, built once.
+
+    Both columns are factorized once and the pairs are counted over the combined integer
+    code: with a single np.bincount for a dense matrix, or with np.unique (only the pairs
+    that occur) for a sparse one. The other orientation is the transpose of the same
+    counts, and the long (row, column, count) table is read off the non-zero cells, so
+    none of them is recomputed from the rows.
+    """
+
+    def __init__(self, counts, row_labels, column_labels):
+        self.counts = counts  # numpy array or scipy.sparse matrix (rows x columns)
+        self.row_labels = row_labels
+        self.column_labels = column_labels
+
+    @property
+    def sparse(self):
+        return not isinstance(self.counts, np.ndarray)
+
+    @property
+    def T(self):
+        """The same counts with rows and columns swapped (no recount)."""
+        return Crosstab(self.counts.T, self.column_labels, self.row_labels)
+
+    def frame(self):
+        """Counts as a DataFrame (rows x columns), with sparse columns for a sparse table."""
+        if self.sparse:
+            return pd.DataFrame.sparse.from_spmatrix(self.counts, index=self.row_labels, columns=self.column_labels)
+        return pd.DataFrame(self.counts, index=self.row_labels, columns=self.column_labels)
+
+    def long(self, name='Count'):
+        """Non-zero cells as a (row, column, count) table, as groupby([row, column]).size().reset_index(name=name)."""
+        if self.sparse:
+            cells = self.counts.tocsr()
+            cells.sort_indices()
+            rows = np.repeat(np.arange(cells.shape[0]), np.diff(cells.indptr))
+            columns, values = cells.indices, cells.data
+        else:
+            rows, columns = np.nonzero(self.counts)
+            values = self.counts[rows, columns]
+        return pd.DataFrame({
+            self.row_labels.name: self.row_labels.take(rows),
+            self.column_labels.name: self.column_labels.take(columns),
+            name: values.astype(np.int64),
+        })
+
+
+def crosstab(rows, columns, sparse=None):
+    """
+    Count the pairs of values of two columns (e.g. Pango lineage x Nextstrain clade).
+
+    Pairs where either value is missing are not counted, and the labels are sorted, as
+    with df.groupby([rows, columns]).size().unstack(fill_value=0).
+
+    Parameters:
+    rows: Series with the values for the rows.
+    columns: Series with the values for the columns.
+    sparse: True for a scipy.sparse matrix, False for a dense array, None to go sparse
+            only above DENSE_CELLS_LIMIT cells (and when scipy is installed).
+
+    Returns:
+    A Crosstab.
+    """
+    row_codes, row_labels = pd.factorize(rows, sort=True)
+    column_codes, column_labels = pd.factorize(columns, sort=True)
+    row_labels = pd.Index(row_labels, name=getattr(rows, 'name', None))
+    column_labels = pd.Index(column_labels, name=getattr(columns, 'name', None))
+    shape = (len(row_labels), len(column_labels))
+
+    if sparse is None:
+        sparse = HAVE_SCIPY and shape[0] * shape[1] > DENSE_CELLS_LIMIT
+    if sparse and not HAVE_SCIPY:
+        raise ImportError("sparse crosstabs need scipy")
+
+    valid = (row_codes >= 0) & (column_codes >= 0)
+    combined = row_codes[valid].astype(np.int64) * shape[1] + column_codes[valid]
+    if sparse:
+        cells, values = np.unique(combined, return_counts=True)
+        counts = scipy.sparse.csr_matrix((values, (cells // shape[1], cells % shape[1])), shape=shape, dtype=np.int64)
+    else:
+        counts = np.bincount(combined, minlength=shape[0] * shape[1]).reshape(shape)
+    return Crosstab(counts, row_labels, column_labels)
@@ -0,0 +1,183 @@
+import os
+import hashlib
+
+from fasta_io import find_header, record_id
+
+# Size of the blocks read from the FASTA while indexing (8 MiB)
+BLOCK_SIZE = 8 * 1024 * 1024
+
+
+
+def _scan_headers(fasta_file, offset=0):
+    """
+    Yield (record_id, record_offset) for every header found at or after 'offset'.
+
+    'offset' must be the start of a line. The record ID is the first word of the
+    header, as in Bio.SeqIO's record.id.
+    """
+    fasta_file.seek(offset)
+    base = offset  # Absolute position of data[0] in the file
+    carry = b""  # Incomplete last line of the previous block
+
+    while True:
+        block = fasta_file.read(BLOCK_SIZE)
+        if not block:
+            break
+        data = carry + block if carry else block
+
+        # Only look at complete lines, keep the rest for the next block
+        cut = data.rfind(b"\n") + 1
+        if cut == 0:
+            carry = data
+            continue
+
+        start = find_header(data, 0, cut)
+        while start != -1:
+            end = data.find(b"\n", start, cut)
+            yield record_id(data[start + 1:end]), base + start
+            start = find_header(data, end + 1, cut)
+
+        base += cut
+        carry = data[cut:]
+
+    # Last line without a trailing newline
+    if carry.startswith(b">"):
+        yield record_id(carry[1:]), base
+
+
+def _update_fingerprint(fingerprint, fasta_file, start, stop):
+    """Feed bytes start..stop of the file to a running hash of its content (a fingerprint)."""
+    fasta_file.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        block = fasta_file.read(min(BLOCK_SIZE, remaining))
+        if not block:
+            break
+        fingerprint.update(block)
+        remaining -= len(block)
+    return fingerprint
+
+
+def _read_index(index_path):
+    """Read an index file, returning (size, mtime_ns, fingerprint, index) or None if unusable."""
+    try:
+        with open(index_path, "r") as index_file:
+            aux = index_file.readline().rstrip("\n").split("\t")
+            if len(aux) != 4 or aux[0] != "#fasta_index":
+                return None
+            index = {}
+            for line in index_file:
+                rid, offset, length = line.rstrip("\n").split("\t")
+                index[rid] = (int(offset), int(length))
+    except (OSError, ValueError):
+        return None
+    return int(aux[1]), int(aux[2]), aux[3], index
+
+
+def _write_index(index_path, size, mtime_ns, fingerprint, index):
+    """Write the index next to the FASTA, replacing any previous one atomically."""
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w") as index_file:
+        index_file.write(f"#fasta_index\t{size}\t{mtime_ns}\t{fingerprint}\n")
+        for rid, (offset, length) in index.items():
+            index_file.write(f"{rid}\t{offset}\t{length}\n")
+    os.replace(tmp_path, index_path)
+
+
+def index_fasta(fasta_path, index_path=None):
+    """
+    Return a dictionary mapping each record ID of a FASTA file to its (offset, length) in bytes.
+
+    The index is kept on disk in 'index_path' (by default the FASTA path plus '.idx')
+    and reused while the FASTA is unchanged. When the FASTA has only been appended to
+    (the part indexed before still has the same hash), just the new records are scanned;
+    any other change triggers a full rebuild. Any change of size or modification time,
+    even a plain 'touch', makes the whole previously indexed part be read and hashed
+    again, so reusing the index then costs one full read of the file.
+    If an ID appears more than once, the last occurrence wins.
+
+    Parameters:
+    fasta_path: Path to an uncompressed FASTA file.
+    index_path: Where to store the index; defaults to fasta_path + '.idx'.
+
+    Returns:
+    index: Dictionary {record_id: (offset, length)}.
+    """
+    if fasta_path.endswith((".gz", ".xz")):
+        raise ValueError(f"Cannot index compressed FASTA {fasta_path}; decompress it first")
+    if index_path is None:
+        index_path = fasta_path + ".idx"
+
+    stat = os.stat(fasta_path)
+    size, mtime_ns = stat.st_size, stat.st_mtime_ns
+    previous = _read_index(index_path)
+
+    with open(fasta_path, "rb") as fasta_file:
+        index = {}
+        scan_from = 0
+        fingerprint = hashlib.blake2b(digest_size=16)
+        hashed = 0  # Bytes of the file already fed to 'fingerprint'
+
+        if previous is not None:
+            old_size, old_mtime_ns, old_fingerprint, old_index = previous
+
+            # Same file as last time: nothing to do
+            if old_size == size and old_mtime_ns == mtime_ns:
+                return old_index
+
+            # The file was rewritten with the same content or only appended to (the whole
+            # indexed part hashes as before): keep the old entries and only scan what follows
+            if old_size <= size:
+                hashed = old_size
+                _update_fingerprint(fingerprint, fasta_file, 0, old_size)
+            if old_size <= size and fingerprint.hexdigest() == old_fingerprint:
+                index = old_index
+                scan_from = old_size
+                if old_size < size and index:
+                    # The last record may have grown, so rescan it from its header
+                    last_id = max(index, key=lambda rid: index[rid][0])
+                    scan_from = index.pop(last_id)[0]
+
+        # Scan the (remaining) headers and turn consecutive offsets into lengths
+        last_id, last_offset = None, None
+        for rid, offset in _scan_headers(fasta_file, scan_from):
+            if last_id is not None:
+                index[last_id] = (last_offset, offset - last_offset)
+            last_id, last_offset = rid, offset
+        if last_id is not None:
+            index[last_id] = (last_offset, size - last_offset)
+
+        fingerprint = _update_fingerprint(fingerprint, fasta_file, hashed, size).hexdigest()
+
+    _write_index(index_path, size, mtime_ns, fingerprint, index)
+    return index
+
+
+def extract_records(fasta_path, record_ids, output_path, index=None):
+    """
+    Copy the records listed in 'record_ids' from a FASTA file to 'output_path' by seeking.
+
+    Records are written verbatim, in the order of 'record_ids'; IDs missing from the
+    FASTA are skipped. Returns the list of IDs that were found and written. A ValueError
+    is raised if an offset no longer points at the header of its record (stale index).
+    """
+    if index is None:
+        index = index_fasta(fasta_path)
+
+    found = []
+    with open(fasta_path, "rb") as fasta_file, open(output_path, "wb") as output_file:
+        for wanted in record_ids:
+            if wanted not in index:
+                continue
+            offset, length = index[wanted]
+            fasta_file.seek(offset)
+            record = fasta_file.read(length)
+            header_end = record.find(b"\n")
+            if not record.startswith(b">") or record_id(record[1:header_end if header_end != -1 else len(record)]) != wanted:
+                raise ValueError(f"Index of {fasta_path} is stale: no record {wanted} at offset {offset}")
+            output_file.write(record)
+            # The last record of the FASTA may not end with a newline
+            if not record.endswith(b"\n"):
+                output_file.write(b"\n")
+            found.append(wanted)
+    return found
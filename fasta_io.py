@@ -0,0 +1,141 @@
+import gzip
+import lzma
+import mmap
+import os
+
+# Size of the blocks read from compressed FASTA files (8 MiB)
+BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def open_fasta(path, mode="rb"):
+    """
+    Open a FASTA file in binary mode, transparently handling compression.
+
+    Files ending in '.gz' are opened with gzip and files ending in '.xz' with lzma;
+    anything else is opened as a plain file.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, compresslevel=6)
+    if path.endswith(".xz"):
+        return lzma.open(path, mode)
+    return open(path, mode)
+
+
+def find_header(data, pos, stop):
+    """Return the offset of the next line starting with '>' in data[pos:stop], or -1."""
+    # '>' is rare in FASTA data, so searching for it alone is much faster than for '\n>'
+    start = data.find(b">", pos, stop)
+    while start > 0 and data[start - 1] != 0x0A:
+        start = data.find(b">", start + 1, stop)
+    return start
+
+
+def record_id(header):
+    """Return the first word of a header (without the '>') as a string, like Bio.SeqIO's record.id."""
+    words = bytes(header).split(None, 1)
+    return words[0].decode() if words else ""
+
+
+def clean_sequence(sequence):
+    """Return the sequence as bytes with the line breaks removed."""
+    return bytes(sequence).translate(None, b"\r\n")
+
+
+def _split_records(data, start, stop, headers_before=None):
+    """
+    Yield (header, sequence) memoryviews for every record in data[start:stop].
+
+    'header' is the header line without the '>' and line break; 'sequence' holds the
+    sequence lines exactly as stored, line breaks included. If 'headers_before' is
+    given, only the records whose header starts before that offset are yielded (the
+    last one still extends up to the next header or 'stop').
+    """
+    if headers_before is None:
+        headers_before = stop
+    view = memoryview(data)
+    start = find_header(data, start, headers_before)
+    while start != -1:
+        eol = data.find(b"\n", start, stop)
+        if eol == -1:
+            # Header on the last line, without sequence
+            yield view[start + 1:stop], view[stop:stop]
+            return
+        following = find_header(data, eol + 1, stop)
+        end = stop if following == -1 else following
+
+        header_end = eol - 1 if eol > start + 1 and data[eol - 1] == 0x0D else eol
+        yield view[start + 1:header_end], view[eol + 1:end]
+        start = following if following < headers_before else -1
+
+
+def _read_stream(fasta_file, block_size):
+    """Yield the records of a file object that cannot be memory-mapped, block by block."""
+    buffer = b""
+    while True:
+        block = fasta_file.read(block_size)
+        if not block:
+            break
+        buffer = buffer + block if buffer else block
+
+        # Every record before the last header of the buffer is complete
+        last = buffer.rfind(b"\n>") + 1
+        if last > 0:
+            yield from _split_records(buffer, 0, last)
+            buffer = buffer[last:]
+
+    yield from _split_records(buffer, 0, len(buffer))
+
+
+def read_fasta(path, block_size=BLOCK_SIZE, start=0, stop=None):
+    """
+    Iterate over the records of a FASTA file as (header, sequence) memoryviews.
+
+    Plain files are memory-mapped, so the views point straight into the page cache
+    and nothing is copied until the caller converts them (e.g. with bytes()). The
+    views stay valid as long as they are referenced. Compressed files ('.gz', '.xz')
+    are decompressed and read block by block instead.
+
+    Parameters:
+    path: FASTA file to read.
+    block_size: Number of bytes decompressed at a time for compressed files.
+    start, stop: Byte range of a plain file to read. Only the records whose header
+                 starts in [start, stop) are returned, each one in full, so a file can
+                 be split into consecutive ranges without losing or repeating records.
+
+    Yields:
+    header: The header line without the leading '>' and the line break.
+    sequence: The sequence lines exactly as stored in the file, line breaks included.
+    """
+    if path.endswith((".gz", ".xz")):
+        if start != 0 or stop is not None:
+            raise ValueError(f"Cannot read a byte range of compressed FASTA {path}")
+        with open_fasta(path, "rb") as fasta_file:
+            yield from _read_stream(fasta_file, block_size)
+        return
+
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as fasta_file:
+        # The map keeps its own handle on the file, so it outlives the 'with' block
+        # and is released once the last view into it is gone
+        data = mmap.mmap(fasta_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(data, "madvise"):
+        data.madvise(mmap.MADV_SEQUENTIAL)
+    yield from _split_records(data, start, size, headers_before=size if stop is None else min(stop, size))
+
+
+def write_record(output_file, header, sequence):
+    """
+    Write one record verbatim to a binary file object.
+
+    'header' is written after a '>' and 'sequence' as it is, adding a final line
+    break if it does not end with one.
+    """
+    output_file.write(b">")
+    output_file.write(header)
+    output_file.write(b"\n")
+    if sequence:
+        output_file.write(sequence)
+        if sequence[-1:] != b"\n":
+            output_file.write(b"\n")
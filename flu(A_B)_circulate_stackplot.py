@@ -1,38 +1,9 @@
 # Importing necessary libraries
+import os
 import pandas as pd
 import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from datetime import datetime
-
-# Define a helper function to ensure that df2 includes all columns and indexes from df1
-def complete_dataframe(df1=None, df2=None, with_nonzero=False):
-    # Include columns from df1 that are not in df2
-    COLUMNS1 = df1.columns
-    COLUMNS2 = df2.columns
-
-    for C1 in COLUMNS1:
-        if C1 not in COLUMNS2:
-            df2[C1] = None
-    
-    # Include indexes from df1 that are not in df2
-    INDEX1 = df1.index
-    INDEX2 = df2.index
-
-    for I1 in INDEX1:
-        if I1 not in INDEX2:
-            if with_nonzero:
-                df2.loc[I1] = None
-                df2 = df2.sort_index()
-                Idx = np.where(df2.index == I1)[0][0]
-                if Idx != 0:
-                    df2.loc[I1] = df2.iloc[Idx - 1, :]
-                else:
-                    df2.loc[I1] = df2.iloc[Idx + 1, :]
-            else:
-                df2.loc[I1] = None
-    df2 = df2.sort_index()
-    df2 = df2.fillna(0)
-    return df2
+from stackplot_data import align_frame, daily_cube, roll_up  # Shared alignment and time binning of the frequency tables
+from count_store import CountStore  # Persisted counts updated with the new batches only
 
 # Set parameters for plot appearance
 params = {
@@ -45,33 +16,54 @@ params = {
 }
 plt.rcParams.update(params)
 
-# Load the DataFrame from a CSV file
-df = pd.read_csv("ALL_flu_2023.csv", sep=",", index_col=False)
-df
-
-# Select relevant columns from the DataFrame
-df = df[['Country', 'Collection_Date', 'Lineage']]
-# Reset index and convert 'Collection_Date' to datetime format
-df.reset_index(drop=True, inplace=True)
-df['Collection_Date'] = pd.to_datetime(df['Collection_Date'])
-
 # Define the date range for the plot
 start_date = pd.Period('2023-01', freq='M')
 end_date = pd.Period('2023-12', freq='M')
-all_months = pd.period_range(start=start_date, end=end_date, freq='M')
-
-# Group data by month and lineage, and count occurrences
-df['month'] = df['Collection_Date'].dt.to_period('M')
-df1 = df.groupby(['month', 'Lineage']).size().unstack(fill_value=0)
-
-# Reindex the DataFrame to include all months in the specified range
-df1 = df1.reindex(all_months, fill_value=0)
 
-# Ensure all lineage columns are included
-df1 = df1.reindex(columns=df1.columns.union(df['Lineage'].unique()))
+# Time resolution of the plot: 'M' (months), 'W' (epidemiological weeks), 'D' (days) or a number
+# of days (windows starting on the first day of the range). The counts are made once per day and
+# rolled up to this resolution, so changing it or the date range does not re-read the metadata
+RESOLUTION = 'M'
+
+# Persisted daily counts (see count_store.py): when COUNT_STORE is set, only the metadata
+# files listed in NEW_BATCHES (e.g. this week's sequences) are read and added to the store,
+# and the figure is drawn from the stored counts instead of re-reading the whole CSV history
+COUNT_STORE = None
+NEW_BATCHES = []
+
+if COUNT_STORE:
+    store = CountStore(COUNT_STORE, freq='D')
+    for path in NEW_BATCHES:
+        batch = pd.read_csv(path, sep=",", usecols=['Country', 'Collection_Date', 'Lineage'])
+        store.add(batch, 'Collection_Date', 'Lineage', region='Country', batch_id=os.path.abspath(path))
+
+    # Counts by period and lineage, on all the periods of the range
+    counts, regions, day_axis, lineages = store.cube()
+    counts, periods = roll_up(counts.sum(axis=0), day_axis, RESOLUTION, start=start_date, end=end_date)
+    df1 = pd.DataFrame(counts, index=periods, columns=lineages)
+    unique_clades = set(df1.columns)
+else:
+    # Load the DataFrame from a CSV file
+    df = pd.read_csv("ALL_flu_2023.csv", sep=",", index_col=False)
+    df
+
+    # Select relevant columns from the DataFrame
+    df = df[['Country', 'Collection_Date', 'Lineage']]
+    # Reset index and convert 'Collection_Date' to datetime format
+    df.reset_index(drop=True, inplace=True)
+    df['Collection_Date'] = pd.to_datetime(df['Collection_Date'])
+
+    # Count occurrences by day and lineage once, and roll them up to the chosen resolution
+    # over all the periods in the specified range
+    counts, regions, day_axis, lineages = daily_cube(df, 'Country', 'Collection_Date', 'Lineage')
+    counts, periods = roll_up(counts.sum(axis=0), day_axis, RESOLUTION, start=start_date, end=end_date)
+    df1 = pd.DataFrame(counts, index=periods, columns=lineages)
+
+    # Include all lineage columns
+    df1 = align_frame(df1, columns=df1.columns.union(df['Lineage'].unique()))
+    unique_clades = set(df['Lineage'])
 
 # Define colors for each lineage
-unique_clades = set(df['Lineage'])
 clade_color_dict = {
     "H1N1": "#b2df8a", "H3N2": "#1f78b4", "Victoria": "#fb9a99"
 }
@@ -79,12 +71,12 @@ clade_color_dict = {
 # Create the figure and axes for the plot with specified size
 fig, ax = plt.subplots(figsize=(16, 7))  # Decreased the height of the plot
 
-# Calculate frequency percentages for each lineage per month
+# Calculate frequency percentages for each lineage per period
 freq_por_mes = df1.T / df1.sum(axis=1) * 100
 freq_por_mes = freq_por_mes.T
 
 # Get dates and colors for the plot
-days = [str(month) for month in freq_por_mes.index]
+days = [str(period) for period in freq_por_mes.index]
 clade_colors = [clade_color_dict.get(c, "#333333") for c in freq_por_mes.columns]
 
 # Create a stacked area plot
@@ -1,43 +1,6 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-import numpy as np
-
-def complete_dataframe(df1=None, df2=None, with_nonzero=False):
-    """
-    Ensures that df2 has the same columns and rows as df1. 
-    If a column or row is missing in df2, it is added. 
-    Missing values are filled with 0, or with the nearest non-zero value if 'with_nonzero' is set to True.
-    """
-    # Get column names from both DataFrames
-    COLUMNS1 = df1.columns
-    COLUMNS2 = df2.columns
-
-    # Add missing columns from df1 to df2
-    for C1 in COLUMNS1:
-        if C1 not in COLUMNS2:
-            df2[C1] = None
-
-    # Get index (rows) from both DataFrames
-    INDEX1 = df1.index
-    INDEX2 = df2.index
-
-    # Add missing rows from df1 to df2, optionally filling missing values
-    for I1 in INDEX1:
-        if I1 not in INDEX2:
-            if with_nonzero:
-                df2.loc[I1] = None
-                df2 = df2.sort_index()
-                Idx = np.where(df2.index == I1)[0][0]
-                if Idx != 0:
-                    df2.loc[I1] = df2.iloc[Idx-1, :]  # Fill with previous row if possible
-                else:
-                    df2.loc[I1] = df2.iloc[Idx+1, :]  # Fill with next row if first in list
-            else:
-                df2.loc[I1] = None  # Fill with None if with_nonzero is False
-    
-    df2 = df2.sort_index()
-    df2 = df2.fillna(0)  # Replace NaN values with 0
-    return df2
+from stackplot_data import count_cube, percentages  # Region x month x lineage counts in one pass
 
 # Plot settings to control legend, figure size, and axis labels
 params = {'legend.fontsize': 14,
@@ -60,15 +23,9 @@ df.reset_index(drop=True, inplace=True)
 # Convert 'collection_date' to datetime format
 df['collection_date'] = pd.to_datetime(df['collection_date'])
 
-# Generate a sorted list of unique locations (UPA)
-UPA = list(set(df['UPA'].values))
-UPA = [i for i in UPA if i == i]
-UPA.sort()
-
-# Group data by month and lineage
-df1 = df[['collection_date', 'lineage']]
-df1['month'] = df1['collection_date'].dt.to_period('M')
-df1 = df1.groupby(['month', 'lineage']).size().unstack(fill_value=0)
+# Count the sequences by location (UPA), month and lineage in a single pass;
+# 'UPA' is the sorted list of unique locations
+counts, UPA, months, lineages = count_cube(df, 'UPA', 'collection_date', 'lineage', freq='M')
 
 # Get unique clades (lineages) from the dataset
 unique_clades = set(df['lineage'])
@@ -82,6 +39,7 @@ num_rows = (num_plots + 1) // 2
 fig, axs = plt.subplots(num_rows, 2, figsize=(16, 12), constrained_layout=True, gridspec_kw={'hspace': 0.1, 'wspace': 0.075})
 
 # Loop variables for legend handling and tracking max frequency
+max_freq_value = 0
 all_labels = []
 handles = []
 labels = []
@@ -94,22 +52,11 @@ for ITER in range(num_plots):
     
     if ITER == 0:
         # For the first plot (Brazil as a whole), calculate the frequency of clades per month
-        freq_por_mes = df1.T / df1.sum(axis=1) * 100  # Convert counts to percentages
-        freq_por_mes = freq_por_mes.T
+        freq_por_mes = percentages(counts.sum(axis=0), months, lineages)  # Convert counts to percentages
     else:
         COUNT += 1
-        # Filter data for the current UPA (location)
-        df2 = df.loc[np.where(df['UPA'] == UPA[COUNT])]
-        df2 = df2[['collection_date', 'lineage']]
-        df2['month'] = df2['collection_date'].dt.to_period('M')
-        
-        # Calculate the frequency of clades for this specific location
-        freq_por_mes = df2.groupby(['month', 'lineage']).size().unstack(fill_value=0)
-        freq_por_mes = freq_por_mes.T / freq_por_mes.sum(axis=1) * 100  # Convert to percentage
-        freq_por_mes = freq_por_mes.T
-
-        # Ensure df2 has the same columns and rows as the main DataFrame df1
-        freq_por_mes = complete_dataframe(df1=df1, df2=freq_por_mes, with_nonzero=False)
+        # Frequency of clades for this specific location, on the same months and clades as Brazil
+        freq_por_mes = percentages(counts[COUNT], months, lineages)
     
     # Track the maximum frequency value for consistent y-axis scaling
     max_freq_value = max(max_freq_value, freq_por_mes.values.max())
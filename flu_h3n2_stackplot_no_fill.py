@@ -1,40 +1,6 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-import numpy as np
-
-# Function to ensure both dataframes have the same structure by including missing columns and indexes
-def complete_dataframe(df1=None, df2=None, with_nonzero=False):
-    # Get columns from both dataframes
-    COLUMNS1 = df1.columns
-    COLUMNS2 = df2.columns
-
-    # Add missing columns from df1 into df2
-    for C1 in COLUMNS1:
-        if C1 not in COLUMNS2:
-            df2[C1] = None  # Set missing columns to None
-    
-    # Get indexes from both dataframes
-    INDEX1 = df1.index
-    INDEX2 = df2.index
-
-    # Add missing indexes from df1 into df2
-    for I1 in INDEX1:
-        if I1 not in INDEX2:
-            if with_nonzero:  # If requested, fill missing indexes with adjacent data
-                df2.loc[I1] = None
-                df2 = df2.sort_index()  # Sort index to maintain order
-                Idx = np.where(df2.index == I1)[0][0]
-                if Idx != 0:
-                    df2.loc[I1] = df2.iloc[Idx - 1, :]
-                else:
-                    df2.loc[I1] = df2.iloc[Idx + 1, :]
-            else:
-                df2.loc[I1] = None  # Just set missing index to None
-
-    # Sort index again after modification and fill remaining NaN values with 0
-    df2 = df2.sort_index()
-    df2 = df2.fillna(0)
-    return df2
+from stackplot_data import count_cube, percentages  # Region x month x lineage counts in one pass
 
 # Set general plot parameters such as font sizes and figure size
 params = {
@@ -57,15 +23,9 @@ df.reset_index(drop=True, inplace=True)
 # Convert collection_date to datetime format for time-based operations
 df['collection_date'] = pd.to_datetime(df['collection_date'])
 
-# Get the unique values from the 'macroregion' column, ensuring non-null values
-MACRORIGIONS = list(set(df['macroregion'].values))
-MACRORIGIONS = [i for i in MACRORIGIONS if i == i]
-MACRORIGIONS.sort()  # Sort the macroregions alphabetically or logically
-
-# Create a new dataframe grouped by 'month' and 'lineage' and count occurrences for df1
-df1 = df[['collection_date', 'lineage']]
-df1['month'] = df1['collection_date'].dt.to_period('M')  # Convert dates to monthly periods
-df1 = df1.groupby(['month', 'lineage']).size().unstack(fill_value=0)  # Group by month and lineage
+# Count the sequences by macroregion, month and lineage in a single pass;
+# 'MACRORIGIONS' is the sorted list of non-null macroregions
+counts, MACRORIGIONS, months, lineages = count_cube(df, 'macroregion', 'collection_date', 'lineage', freq='M')
 
 # Create a dictionary mapping unique clades (lineages) to specific colors for the plot
 clade_color_dict = {
@@ -93,21 +53,11 @@ for ITER in range(num_plots):
 
     if ITER == 0:
         # First plot is for the whole dataset (Brazil)
-        freq_por_mes = df1
-        freq_por_mes = freq_por_mes.T / freq_por_mes.sum(axis=1) * 100  # Normalize to percentages
-        freq_por_mes = freq_por_mes.T
+        freq_por_mes = percentages(counts.sum(axis=0), months, lineages)  # Normalize to percentages
     else:
         COUNT += 1
-        # Filter data for each specific macroregion
-        df2 = df.loc[np.where(df['macroregion'] == MACRORIGIONS[COUNT])]
-        df2 = df2[['collection_date', 'lineage']]
-        df2['month'] = df2['collection_date'].dt.to_period('M')
-        freq_por_mes = df2.groupby(['month', 'lineage']).size().unstack(fill_value=0)
-        freq_por_mes = freq_por_mes.T / freq_por_mes.sum(axis=1) * 100
-        freq_por_mes = freq_por_mes.T
-
-        # Complete the dataframe with missing data
-        freq_por_mes = complete_dataframe(df1=df1, df2=freq_por_mes, with_nonzero=False)
+        # Slice of the counts for each specific macroregion, on the same months and lineages as Brazil
+        freq_por_mes = percentages(counts[COUNT], months, lineages)
 
     # Update max frequency for setting uniform y-axis limits
     max_freq_value = max(max_freq_value, freq_por_mes.values.max())
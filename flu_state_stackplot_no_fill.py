@@ -1,41 +1,9 @@
 # Import necessary libraries
+import os
 import pandas as pd  # For data manipulation and analysis
 import matplotlib.pyplot as plt  # For plotting graphs
-import numpy as np  # For numerical operations
-
-# Function to ensure that the second DataFrame (df2) includes all columns and indexes from the first (df1)
-def complete_dataframe(df1=None, df2=None, with_nonzero=False):
-    # Get columns from df1 and df2
-    COLUMNS1 = df1.columns
-    COLUMNS2 = df2.columns
-
-    # Add missing columns from df1 to df2
-    for C1 in COLUMNS1:
-        if C1 not in COLUMNS2:
-            df2[C1] = None
-    
-    # Get indexes from df1 and df2
-    INDEX1 = df1.index
-    INDEX2 = df2.index
-
-    # Add missing indexes from df1 to df2, with optional interpolation
-    for I1 in INDEX1:
-        if I1 not in INDEX2:
-            if with_nonzero:
-                df2.loc[I1] = None  # Add missing index to df2
-                df2 = df2.sort_index()  # Sort the DataFrame by index
-                # Get index location of the new row
-                Idx = np.where(df2.index == I1)[0][0]
-                # If the index is not the first row, copy values from the previous row
-                if Idx != 0:
-                    df2.loc[I1] = df2.iloc[Idx - 1, :]
-                else:
-                    df2.loc[I1] = df2.iloc[Idx + 1, :]
-            else:
-                df2.loc[I1] = None  # Otherwise, set the missing row as None
-    df2 = df2.sort_index()  # Sort the DataFrame again
-    df2 = df2.fillna(0)  # Replace NaN values with 0
-    return df2
+from stackplot_data import align_frame, daily_cube, roll_up  # Shared alignment and time binning of the frequency tables
+from count_store import CountStore  # Persisted counts updated with the new batches only
 
 # Configuration of parameters for the plots
 params = {
@@ -48,32 +16,53 @@ params = {
 }
 plt.rcParams.update(params)  # Update plot parameters
 
-# Load the DataFrame from a CSV file
-df = pd.read_csv("result_metadata_final_graficos_estado_com_UPAS.csv", sep=",", index_col=False)
-df
-
-# Select only relevant columns: 'estado', 'date', and 'short-clade'
-df = df[['estado', 'date', 'short-clade']]
-df.reset_index(drop=True, inplace=True)  # Reset the DataFrame index
-df['date'] = pd.to_datetime(df['date'])  # Convert 'date' column to datetime format
-
 # Define the desired date range
 start_date = pd.Period('2023-04', freq='M')  # Start in April 2023
 end_date = pd.Period('2024-05', freq='M')  # End in May 2024
-all_months = pd.period_range(start=start_date, end=end_date, freq='M')  # Generate a range of months
-
-# Group the data by month and clade (variant) and count occurrences
-df['month'] = df['date'].dt.to_period('M')  # Extract the month from the 'date' column
-df1 = df.groupby(['month', 'short-clade']).size().unstack(fill_value=0)  # Count occurrences by clade per month
-
-# Reindex the DataFrame to ensure all months in the range are included, even if no data exists for some
-df1 = df1.reindex(all_months, fill_value=0)
 
-# Ensure all clades (variants) are included as columns
-df1 = df1.reindex(columns=df1.columns.union(df['short-clade'].unique()))
+# Time resolution of the plot: 'M' (months), 'W' (epidemiological weeks), 'D' (days) or a number
+# of days (windows starting on the first day of the range). The counts are made once per day and
+# rolled up to this resolution, so changing it or the date range does not re-read the metadata
+RESOLUTION = 'M'
+
+# Persisted daily counts (see count_store.py): when COUNT_STORE is set, only the metadata
+# files listed in NEW_BATCHES (e.g. this week's sequences) are read and added to the store,
+# and the figure is drawn from the stored counts instead of re-reading the whole CSV history
+COUNT_STORE = None
+NEW_BATCHES = []
+
+if COUNT_STORE:
+    store = CountStore(COUNT_STORE, freq='D')
+    for path in NEW_BATCHES:
+        batch = pd.read_csv(path, sep=",", usecols=['estado', 'date', 'short-clade'])
+        store.add(batch, 'date', 'short-clade', region='estado', batch_id=os.path.abspath(path))
+
+    # Counts by period and clade, on all the periods of the range
+    counts, regions, day_axis, clades = store.cube()
+    counts, periods = roll_up(counts.sum(axis=0), day_axis, RESOLUTION, start=start_date, end=end_date)
+    df1 = pd.DataFrame(counts, index=periods, columns=clades)
+    unique_clades = set(df1.columns)  # Get the unique clades (variants)
+else:
+    # Load the DataFrame from a CSV file
+    df = pd.read_csv("result_metadata_final_graficos_estado_com_UPAS.csv", sep=",", index_col=False)
+    df
+
+    # Select only relevant columns: 'estado', 'date', and 'short-clade'
+    df = df[['estado', 'date', 'short-clade']]
+    df.reset_index(drop=True, inplace=True)  # Reset the DataFrame index
+    df['date'] = pd.to_datetime(df['date'])  # Convert 'date' column to datetime format
+
+    # Count occurrences by day and clade (variant) once, then roll them up to the chosen
+    # resolution over all the periods of the range, even if no data exists for some
+    counts, regions, day_axis, clades = daily_cube(df, 'estado', 'date', 'short-clade')
+    counts, periods = roll_up(counts.sum(axis=0), day_axis, RESOLUTION, start=start_date, end=end_date)
+    df1 = pd.DataFrame(counts, index=periods, columns=clades)
+
+    # Ensure all clades (variants) are included as columns
+    df1 = align_frame(df1, columns=df1.columns.union(df['short-clade'].unique()))
+    unique_clades = set(df['short-clade'])  # Get the unique clades (variants)
 
 # Define colors for each clade (variant) for the plot
-unique_clades = set(df['short-clade'])  # Get the unique clades (variants)
 clade_color_dict = {
     "5a.2a.1": "#8dd3c7",  # Light teal for clade 5a.2a.1
     "5a.2a": "#fccde5",  # Pink for clade 5a.2a
@@ -85,12 +74,12 @@ clade_color_dict = {
 # Create the figure and axes with specified size
 fig, ax = plt.subplots(figsize=(16, 8))  # Set figure size to 16 inches wide, 8 inches tall
 
-# Calculate the frequency of each clade by month in percentage
+# Calculate the frequency of each clade by period in percentage
 freq_por_mes = df1.T / df1.sum(axis=1) * 100  # Calculate percentages
 freq_por_mes = freq_por_mes.T  # Transpose back
 
-# Get the month labels and corresponding colors for the clades
-days = [str(month) for month in freq_por_mes.index]  # Convert month objects to string for plotting
+# Get the period labels and corresponding colors for the clades
+days = [str(period) for period in freq_por_mes.index]  # Convert period labels to string for plotting
 clade_colors = [clade_color_dict.get(c, "#333333") for c in freq_por_mes.columns]  # Assign colors to each clade
 
 # Create a stacked area plot of clade frequencies over time
@@ -0,0 +1,287 @@
+import os
+import shutil
+import tempfile
+import multiprocessing
+from contextlib import ExitStack
+
+from fasta_io import read_fasta, record_id, write_record
+from fasta_index import index_fasta, extract_records
+from sequence_dedup import sequence_digest
+
+
+# Plain FASTA files larger than this are split into byte ranges processed by different workers
+SHARD_SIZE = 256 * 1024 * 1024
+
+# Suffix of the file, next to a treated FASTA, listing the inputs it was made from
+TREATED_INPUTS_SUFFIX = '.inputs'
+
+# Names of the per-shard part files written by the workers, in the order they are merged
+_PARTS = ('renamed', 'concatenated', 'treated')
+
+# Selection set and relabel function of each worker process, set by _init_worker
+_worker_state = {}
+
+
+def isolate_id_from_header(record_id):
+    """Extract the isolate ID (e.g. 'EPI_ISL_402124') from a GISAID FASTA header ID."""
+    return record_id.rsplit('|')[-3]
+
+
+def build_header_index(df):
+    """
+    Precompute the relabelled header of every isolate in 'df', keyed by isolate ID.
+
+    The headers have the form
+    '{Isolate_Id}|flu|ha|{Isolate_Id}|{Collection_Date}|{Continent}|{Country}|{State}'
+    and are built in a single pass over the rows, so relabelling a record is one
+    dictionary lookup instead of a DataFrame scan. Only the first row of each isolate is used.
+    A missing location part is written as 'None', as when the columns come from
+    Series.str.split(expand=True).
+    """
+    rows = df.drop_duplicates('Isolate_Id')
+    dates = rows['Collection_Date'].dt.strftime('%Y-%m-%d')
+    continents, countries, states = (
+        [value if isinstance(value, str) else None for value in rows[column].tolist()]
+        for column in ('Continent', 'Country', 'State'))
+    headers = [
+        f"{isolate_id}|flu|ha|{isolate_id}|{collection_date}|{continent}|{country}|{state}"
+        for isolate_id, collection_date, continent, country, state in zip(
+            rows['Isolate_Id'].tolist(), dates.tolist(), continents, countries, states)
+    ]
+    return dict(zip(rows['Isolate_Id'].tolist(), headers))
+
+
+def _select_and_relabel(records, selected_set, relabel, selected, renamed_file,
+                        concatenated_file=None, treated_file=None, keep=None, dedup=None, source=None):
+    """
+    Write the outputs of process_gisaid_fasta for an iterable of (header, sequence) records.
+
+    Selected sequences are stored in the 'selected' dictionary (isolate ID -> sequence).
+    Duplicates are skipped either from a precomputed 'keep' mask (one flag per record)
+    or by asking 'dedup', a SequenceDeduplicator, about each record of file 'source'.
+    Returns the number of records written to 'renamed_file'.
+    """
+    renamed = 0
+    for number, (header, sequence) in enumerate(records):
+        isolate_id = isolate_id_from_header(record_id(header))
+
+        # Skip the records whose sequence was already written
+        if keep is not None and not keep[number]:
+            continue
+        if dedup is not None and not dedup.keep(isolate_id, sequence, source):
+            continue
+
+        if concatenated_file is not None:
+            write_record(concatenated_file, header, sequence)
+
+        # Treated record: the isolate ID alone as header
+        if treated_file is not None:
+            write_record(treated_file, isolate_id.encode(), sequence)
+        if isolate_id in selected_set:
+            selected[isolate_id] = bytes(sequence)
+
+        # Relabelled record: header built from the metadata
+        new_id = relabel(isolate_id)
+        if new_id is not None:
+            write_record(renamed_file, new_id.encode(), sequence)
+            renamed += 1
+    return renamed
+
+
+def _init_worker(selected_set, relabel):
+    """Store the selection set and relabel function once per worker process."""
+    _worker_state['selected_set'] = selected_set
+    _worker_state['relabel'] = relabel
+
+
+def _read_shard(fasta_path, start, stop):
+    """Return the records of a whole file (start is None) or of a byte range."""
+    if start is None:
+        return read_fasta(fasta_path)
+    return read_fasta(fasta_path, start=start, stop=stop)
+
+
+def _hash_shard(task):
+    """Return the (isolate ID, digest) of every record of one file or byte range."""
+    fasta_path, start, stop, include_isolate_id = task
+    hashed = []
+    for header, sequence in _read_shard(fasta_path, start, stop):
+        isolate_id = isolate_id_from_header(record_id(header))
+        hashed.append((isolate_id, sequence_digest(sequence, isolate_id if include_isolate_id else None)))
+    return hashed
+
+
+def _process_shard(task):
+    """Process one file or byte range in a worker, writing its outputs to part files."""
+    fasta_path, start, stop, part_prefix, parts, keep = task
+    selected = {}
+    with ExitStack() as stack:
+        files = {part: stack.enter_context(open(f'{part_prefix}.{part}', 'wb')) for part in parts}
+        renamed = _select_and_relabel(
+            _read_shard(fasta_path, start, stop), _worker_state['selected_set'], _worker_state['relabel'],
+            selected, files['renamed'], files.get('concatenated'), files.get('treated'), keep=keep)
+    return selected, renamed
+
+
+def _shard_ranges(fasta_paths, shard_size):
+    """Split the input files into (path, start, stop) tasks; compressed files are not split."""
+    for fasta_path in fasta_paths:
+        if fasta_path.endswith(('.gz', '.xz')):
+            yield fasta_path, None, None
+            continue
+        size = os.path.getsize(fasta_path)
+        for start in range(0, max(size, 1), shard_size):
+            yield fasta_path, start, min(start + shard_size, size)
+
+
+def process_gisaid_fasta(fasta_paths, selected_ids, relabel, selected_path, renamed_path,
+                         concatenated_path=None, treated_path=None, workers=1, shard_size=SHARD_SIZE,
+                         dedup=None):
+    """
+    Read every GISAID FASTA once and write the selected and relabelled outputs in the same pass.
+
+    For each record the isolate ID is extracted from the header and:
+    - if it is in 'selected_ids', the record is kept (with the isolate ID as header)
+      for the selected FASTA, which is written in the order of 'selected_ids';
+    - if 'relabel' returns a new header for it, the record is written to the relabelled FASTA.
+    Only the headers change: sequence lines are copied verbatim from the input.
+
+    With more than one worker, files (and byte ranges of large plain files) are processed
+    on a process pool. Each worker writes its records to part files on disk, which are
+    appended to the outputs in input order, so the result is the same as with one worker
+    and memory use does not grow with the number or size of the files.
+
+    With a SequenceDeduplicator as 'dedup', only the first occurrence of each sequence is
+    kept in every output and the dropped duplicates go to its report. With several
+    workers the sequences are hashed in a first parallel pass, so that "first" still
+    follows the input order.
+
+    Parameters:
+    fasta_paths: FASTA files to read, in order.
+    selected_ids: Collection of isolate IDs to extract (supports 'in' and iteration).
+    relabel: Function taking an isolate ID and returning its new header, or None to drop it
+             (e.g. the 'get' method of the dictionary returned by build_header_index).
+             With several workers it must be picklable.
+    selected_path: Output FASTA for the selected isolates.
+    renamed_path: Output FASTA for the relabelled records.
+    concatenated_path: If given, also write all records unchanged to this file.
+    treated_path: If given, also write all records with the isolate ID as header to this file.
+    workers: Number of worker processes.
+    shard_size: Size in bytes of the ranges plain files are split into for the workers.
+    dedup: Optional sequence_dedup.SequenceDeduplicator used to drop duplicate sequences.
+
+    Returns:
+    found_ids: The selected isolate IDs that were found, in the order they were written.
+    renamed: The number of records written to the relabelled FASTA.
+    """
+    selected_set = set(selected_ids)  # Hashed membership test for every record
+    selected = {}  # Isolate ID -> sequence of the selected record
+    renamed = 0
+
+    # The list of inputs is only written once the treated FASTA is complete
+    if treated_path and os.path.exists(treated_path + TREATED_INPUTS_SUFFIX):
+        os.remove(treated_path + TREATED_INPUTS_SUFFIX)
+
+    with ExitStack() as stack:
+        outputs = {'renamed': stack.enter_context(open(renamed_path, 'wb'))}
+        if concatenated_path:
+            outputs['concatenated'] = stack.enter_context(open(concatenated_path, 'wb'))
+        if treated_path:
+            outputs['treated'] = stack.enter_context(open(treated_path, 'wb'))
+
+        if workers <= 1:
+            for fasta_path in fasta_paths:
+                renamed += _select_and_relabel(
+                    read_fasta(fasta_path), selected_set, relabel, selected,
+                    outputs['renamed'], outputs.get('concatenated'), outputs.get('treated'),
+                    dedup=dedup, source=fasta_path)
+        else:
+            # Part files live next to the output so appending them never crosses filesystems
+            part_dir = tempfile.mkdtemp(prefix='gisaid_parts_', dir=os.path.dirname(os.path.abspath(renamed_path)))
+            stack.callback(shutil.rmtree, part_dir, ignore_errors=True)
+            parts = [part for part in _PARTS if part in outputs]
+            shards = list(_shard_ranges(fasta_paths, shard_size))
+            pool = stack.enter_context(multiprocessing.Pool(workers, initializer=_init_worker, initargs=(selected_set, relabel)))
+
+            # Hash every shard in parallel, then decide in input order which records to keep
+            keep_masks = [None] * len(shards)
+            if dedup is not None:
+                hash_tasks = [(fasta_path, start, stop, dedup.include_isolate_id) for fasta_path, start, stop in shards]
+                for number, hashed in enumerate(pool.imap(_hash_shard, hash_tasks)):
+                    fasta_path = shards[number][0]
+                    keep_masks[number] = bytearray(dedup.add(digest, isolate_id, fasta_path) for isolate_id, digest in hashed)
+
+            tasks = [(fasta_path, start, stop, os.path.join(part_dir, str(number)), parts, keep_masks[number])
+                     for number, (fasta_path, start, stop) in enumerate(shards)]
+
+            # imap returns the results in task order, which keeps the merge deterministic
+            for task, (shard_selected, shard_renamed) in zip(tasks, pool.imap(_process_shard, tasks)):
+                selected.update(shard_selected)
+                renamed += shard_renamed
+                for part in parts:
+                    part_path = f'{task[3]}.{part}'
+                    with open(part_path, 'rb') as part_file:
+                        shutil.copyfileobj(part_file, outputs[part], 1024 * 1024)
+                    os.remove(part_path)
+
+    if treated_path:
+        dedup_mode = None if dedup is None else ('isolate' if dedup.include_isolate_id else 'sequence')
+        with open(treated_path + TREATED_INPUTS_SUFFIX, 'w') as inputs_file:
+            inputs_file.write(_treated_inputs(treated_path, fasta_paths, dedup_mode))
+
+    # Write the selected sequences in the order they were requested
+    found_ids = []
+    with open(selected_path, 'wb') as selected_file:
+        for isolate_id in selected_ids:
+            if isolate_id in selected:
+                write_record(selected_file, isolate_id.encode(), selected.pop(isolate_id))
+                found_ids.append(isolate_id)
+    return found_ids, renamed
+
+
+def _treated_inputs(treated_path, fasta_paths, dedup_mode):
+    """Describe a treated FASTA: its own size and mtime, the deduplication mode and (path, size, mtime) of every input, in order."""
+    stat = os.stat(treated_path)
+    lines = [f'#treated_inputs\t{dedup_mode or "none"}\t{stat.st_size}\t{stat.st_mtime_ns}']
+    for fasta_path in fasta_paths:
+        stat = os.stat(fasta_path)
+        lines.append(f'{os.path.abspath(fasta_path)}\t{stat.st_size}\t{stat.st_mtime_ns}')
+    return '\n'.join(lines) + '\n'
+
+
+def treated_is_current(treated_path, fasta_paths, dedup_mode=None):
+    """
+    Tell whether a treated FASTA can stand in for reading 'fasta_paths' again.
+
+    True only if process_gisaid_fasta wrote it, unchanged since, from exactly these input
+    files (same paths in the same order, same sizes and modification times) and with
+    the same deduplication mode (None, 'sequence' or 'isolate').
+    """
+    try:
+        with open(treated_path + TREATED_INPUTS_SUFFIX) as inputs_file:
+            recorded = inputs_file.read()
+        return recorded == _treated_inputs(treated_path, fasta_paths, dedup_mode)
+    except OSError:
+        return False
+
+
+def extract_from_treated(treated_path, selected_ids, relabel, selected_path, renamed_path):
+    """
+    Produce the same outputs as process_gisaid_fasta from a treated FASTA of a previous run.
+
+    The treated FASTA (headers reduced to the isolate ID) is indexed with fasta_index,
+    so only the selected records are read for the selected FASTA. The relabelled FASTA
+    is written in one sequential pass over the treated file, one record per record
+    as in process_gisaid_fasta, so an isolate present in several exports is written
+    every time it appears.
+    """
+    found_ids = extract_records(treated_path, selected_ids, selected_path, index=index_fasta(treated_path))
+
+    renamed = 0
+    with open(renamed_path, 'wb') as renamed_file:
+        for header, sequence in read_fasta(treated_path):
+            new_id = relabel(record_id(header))
+            if new_id is not None:
+                write_record(renamed_file, new_id.encode(), sequence)
+                renamed += 1
+    return found_ids, renamed
@@ -0,0 +1,234 @@
+import os
+import sqlite3
+import argparse
+from datetime import datetime
+
+import pandas as pd
+from metadata_cache import iter_table  # Chunked (and, for Excel, cached) loading of the metadata exports
+
+# Registry used when --db is not given
+DEFAULT_DB = 'id_registry.sqlite'
+
+# Rows read at a time from CSV/TSV files
+CHUNK_SIZE = 500_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id     INTEGER PRIMARY KEY,
+    path        TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL,
+    UNIQUE (path, kind)
+);
+CREATE TABLE IF NOT EXISTS ids (
+    kind       TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    file_id    INTEGER NOT NULL REFERENCES files(file_id),
+    row        INTEGER NOT NULL,
+    isolate_id TEXT
+);
+DROP INDEX IF EXISTS ids_kind_value;
+CREATE INDEX IF NOT EXISTS ids_value_kind ON ids (value, kind);
+CREATE INDEX IF NOT EXISTS ids_isolate ON ids (isolate_id);
+CREATE INDEX IF NOT EXISTS ids_file ON ids (file_id);
+"""
+
+
+def connect(db_path=DEFAULT_DB):
+    """Open (and create if needed) the registry, a single SQLite file usable offline."""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def read_batch(path, column, isolate_column=None, chunksize=CHUNK_SIZE):
+    """
+    Yield (value, row, isolate_id) tuples for the non-empty IDs of a CSV, TSV or Excel file.
+
+    'row' is the row number as a spreadsheet program shows it (the header is row 1).
+    """
+    columns = [column] + ([isolate_column] if isolate_column else [])
+    first_row = 2
+    for chunk in iter_table(path, chunksize, usecols=columns, dtype={name: str for name in columns}):
+        values = chunk[column].str.strip()
+        isolates = chunk[isolate_column].str.strip() if isolate_column else pd.Series(None, index=chunk.index, dtype=object)
+        rows = range(first_row, first_row + len(chunk))
+        for value, row, isolate in zip(values.tolist(), rows, isolates.tolist()):
+            if isinstance(value, str) and value:
+                yield value, row, isolate if isinstance(isolate, str) and isolate else None
+        first_row += len(chunk)
+
+
+def import_file(conn, path, column, kind=None, isolate_column=None, chunksize=CHUNK_SIZE):
+    """
+    Record the IDs of one column of a file in the registry.
+
+    A file is identified by its absolute path and the kind of ID imported from it; if it
+    has the same size and modification time as when it was imported, nothing is read.
+    A modified file replaces its previous rows.
+
+    Parameters:
+    conn: Registry connection (see connect).
+    path: CSV, TSV or Excel file.
+    column: Column holding the IDs.
+    kind: Name under which the IDs are registered (the column name by default), e.g.
+          'CEVIVAS_ID', 'IDENTIFICADOR' or 'hashcode'.
+    isolate_column: Optional column with the isolate ID linked to each ID.
+
+    Returns:
+    Number of IDs imported (0 when the file was already up to date).
+    """
+    kind = kind or column
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    known = conn.execute('SELECT file_id, size, mtime_ns FROM files WHERE path = ? AND kind = ?', (path, kind)).fetchone()
+    if known and known[1:] == (stat.st_size, stat.st_mtime_ns):
+        return 0
+
+    with conn:
+        if known:
+            conn.execute('DELETE FROM ids WHERE file_id = ?', (known[0],))
+            conn.execute('DELETE FROM files WHERE file_id = ?', (known[0],))
+        file_id = conn.execute(
+            'INSERT INTO files (path, kind, size, mtime_ns, ingested_at) VALUES (?, ?, ?, ?, ?)',
+            (path, kind, stat.st_size, stat.st_mtime_ns, datetime.now().isoformat(timespec='seconds')),
+        ).lastrowid
+        cursor = conn.executemany(
+            'INSERT INTO ids (kind, value, file_id, row, isolate_id) VALUES (?, ?, ?, ?, ?)',
+            ((kind, value, file_id, row, isolate) for value, row, isolate in read_batch(path, column, isolate_column, chunksize)),
+        )
+    return cursor.rowcount
+
+
+def query(conn, values, kind=None):
+    """
+    Return every registered occurrence of the given IDs (or isolate IDs), with file and ingestion date.
+
+    The IDs are loaded into a temporary table and looked up in one statement, as two
+    indexed joins (on the ID and on the isolate ID), so each lookup costs the same
+    whatever the size of the registry. Results follow the order of 'values'.
+    """
+    conn.execute('DROP TABLE IF EXISTS temp.lookup')
+    conn.execute('CREATE TEMP TABLE lookup (position INTEGER PRIMARY KEY, value TEXT NOT NULL)')
+    conn.executemany('INSERT INTO lookup (value) VALUES (?)', ((value,) for value in values))
+
+    columns = 'ids.kind AS Kind, ids.value AS ID, ids.isolate_id AS Isolate_Id, files.path AS File, ids.row AS Row, files.ingested_at AS Ingested'
+    kind_filter = ' AND ids.kind = ?' if kind else ''
+    # A row whose ID and isolate ID are both the looked-up value is only returned by the first join
+    result = pd.read_sql_query(f"""
+        SELECT lookup.position, {columns}
+        FROM lookup JOIN ids ON ids.value = lookup.value JOIN files USING (file_id)
+        WHERE 1{kind_filter}
+        UNION ALL
+        SELECT lookup.position, {columns}
+        FROM lookup JOIN ids ON ids.isolate_id = lookup.value JOIN files USING (file_id)
+        WHERE ids.value != lookup.value{kind_filter}
+        ORDER BY 1
+    """, conn, params=(kind, kind) if kind else ())
+    conn.execute('DROP TABLE temp.lookup')
+    return result.drop(columns='position')
+
+
+def diff_batch(conn, path, column, kind=None, match_kind=None, isolate_column=None, chunksize=CHUNK_SIZE):
+    """
+    Check a new batch against the registry without importing it.
+
+    The IDs of the batch are loaded into a temporary table and joined with the indexed
+    registry, so the cost depends on the size of the batch, not of the registry.
+
+    Parameters:
+    conn: Registry connection.
+    path: CSV, TSV or Excel file with the new batch.
+    column: Column holding the IDs.
+    kind: Kind of ID of the batch (the column name by default).
+    match_kind: Kind the batch IDs must be linked to, e.g. 'hashcode' for a list of
+                'IDENTIFICADOR's; IDs not registered under it are reported as missing.
+    isolate_column: Optional column with the isolate ID of each row.
+
+    Returns:
+    duplicates: Batch rows whose ID is repeated in the batch or already registered
+                under 'kind' (by another file), with where it was seen.
+    missing: Batch rows whose ID has no match under 'match_kind' (empty without match_kind).
+    """
+    kind = kind or column
+    path = os.path.abspath(path)
+    conn.execute('DROP TABLE IF EXISTS temp.batch')
+    conn.execute('CREATE TEMP TABLE batch (value TEXT NOT NULL, row INTEGER NOT NULL, isolate_id TEXT)')
+    conn.executemany('INSERT INTO batch VALUES (?, ?, ?)', read_batch(path, column, isolate_column, chunksize))
+    conn.execute('CREATE INDEX temp.batch_value ON batch (value)')
+
+    duplicates = pd.read_sql_query("""
+        SELECT batch.value AS ID, batch.row AS Row, files.path AS Seen_In, ids.row AS Seen_Row, files.ingested_at AS Ingested
+        FROM batch JOIN ids ON ids.kind = ? AND ids.value = batch.value
+        JOIN files USING (file_id)
+        WHERE files.path != ?
+        UNION ALL
+        SELECT batch.value, batch.row, 'this batch', other.row, NULL
+        FROM batch JOIN batch AS other ON other.value = batch.value AND other.row != batch.row
+        ORDER BY ID, Row
+    """, conn, params=(kind, path))
+
+    missing = pd.DataFrame(columns=['ID', 'Row'])
+    if match_kind:
+        missing = pd.read_sql_query("""
+            SELECT batch.value AS ID, batch.row AS Row FROM batch
+            WHERE NOT EXISTS (SELECT 1 FROM ids WHERE ids.kind = ? AND ids.value = batch.value)
+            ORDER BY batch.row
+        """, conn, params=(match_kind,))
+    conn.execute('DROP TABLE temp.batch')
+    return duplicates, missing
+
+
+def main():
+
+    # Set up the argument parser with one sub-command per operation
+    parser = argparse.ArgumentParser(description='Local SQLite registry of the sample IDs seen in the submission and metadata files', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--db', type=str, help='Registry file', default=DEFAULT_DB)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help='Register the IDs of one column of some files', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    import_parser.add_argument('files', nargs='+', help='CSV, TSV or Excel files')
+    import_parser.add_argument('--column', type=str, required=True, help='Column holding the IDs, e.g. CEVIVAS_ID, IDENTIFICADOR or hashcode')
+    import_parser.add_argument('--kind', type=str, help='Name to register the IDs under (the column name by default)', default=None)
+    import_parser.add_argument('--isolate-column', type=str, help='Column with the linked isolate ID', default=None)
+
+    query_parser = commands.add_parser('query', help='Show where IDs (or isolate IDs) were seen')
+    query_parser.add_argument('ids', nargs='+', help='IDs to look up')
+    query_parser.add_argument('--kind', type=str, help='Only this kind of ID', default=None)
+
+    diff_parser = commands.add_parser('diff', help='Check a new batch for duplicates and missing matches', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    diff_parser.add_argument('file', help='CSV, TSV or Excel file with the new batch')
+    diff_parser.add_argument('--column', type=str, required=True, help='Column holding the IDs')
+    diff_parser.add_argument('--kind', type=str, help='Kind of the batch IDs (the column name by default)', default=None)
+    diff_parser.add_argument('--match-kind', type=str, help='Kind every batch ID must match, e.g. hashcode', default=None)
+    diff_parser.add_argument('--isolate-column', type=str, help='Column with the isolate ID of each row', default=None)
+    diff_parser.add_argument('--output', type=str, help='Prefix of the TSV reports (<prefix>_duplicates.tsv, <prefix>_missing.tsv)', default=None)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == 'import':
+        for path in args.files:
+            count = import_file(conn, path, args.column, args.kind, args.isolate_column)
+            print(f"{path}: {count} IDs imported" if count else f"{path}: already up to date")
+
+    elif args.command == 'query':
+        print(query(conn, args.ids, args.kind).to_string(index=False))
+
+    elif args.command == 'diff':
+        duplicates, missing = diff_batch(conn, args.file, args.column, args.kind, args.match_kind, args.isolate_column)
+        print(f"{duplicates['ID'].nunique()} duplicated IDs:")
+        print(duplicates.to_string(index=False))
+        if args.match_kind:
+            print(f"{len(missing)} IDs without a '{args.match_kind}' match:")
+            print(missing.to_string(index=False))
+        if args.output:
+            duplicates.to_csv(f'{args.output}_duplicates.tsv', sep='\t', index=False)
+            missing.to_csv(f'{args.output}_missing.tsv', sep='\t', index=False)
+    conn.close()
+
+if __name__ == "__main__":
+    main()
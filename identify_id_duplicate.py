@@ -1,21 +1,201 @@
 # Import the pandas library for data manipulation
+import argparse
+
+import numpy as np
 import pandas as pd
+from metadata_cache import iter_table  # Chunked (and, for Excel, cached) loading of the metadata exports
+
+# Rows read at a time from CSV/TSV files
+CHUNK_SIZE = 1_000_000
+
+# Location of a row packed in one integer: file number in the high bits, row number in the low 40
+ROW_BITS = 40
+
+
+def read_ids(path, column, chunksize=CHUNK_SIZE):
+    """
+    Yield (first_row, ids) blocks with the values of 'column' of a CSV, TSV or Excel file.
+
+    CSV/TSV files are streamed in chunks; Excel files cannot be streamed and are loaded
+    whole, but only the ID column is parsed (and cached). 'first_row' is the row number of
+    the first ID of the block as a spreadsheet program shows it (the header is row 1).
+    """
+    first_row = 2
+    for chunk in iter_table(path, chunksize, usecols=[column], dtype={column: str}):
+        yield first_row, chunk[column]
+        first_row += len(chunk)
+
+
+def hash_ids(ids):
+    """Return the 64-bit hash of every non-missing ID and the positions of those IDs in the block."""
+    present = np.flatnonzero(ids.notna().to_numpy())
+    values = ids.iloc[present].astype(str).str.strip().to_numpy(dtype=object)
+    return pd.util.hash_array(values), present, values
+
+
+class IdTable:
+    """
+    Compact table mapping ID hashes to the location where each ID was first seen.
+
+    Keys and locations live in a few sorted numpy runs (16 bytes per distinct ID, no
+    Python objects). New IDs are added as a run and runs of similar size are merged, so
+    every ID is moved O(log n) times and a lookup is a binary search in each run.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(keys) for keys, locations in self.runs)
+
+    def lookup(self, hashes):
+        """Return (found, locations) for an array of distinct hashes."""
+        found = np.zeros(len(hashes), dtype=bool)
+        locations = np.zeros(len(hashes), dtype=np.int64)
+        for keys, run_locations in self.runs:
+            positions = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+            hit = keys[positions] == hashes
+            found |= hit
+            locations[hit] = run_locations[positions[hit]]
+        return found, locations
+
+    def add(self, hashes, locations):
+        """Add new (sorted, distinct, absent) hashes with the location of their first occurrence."""
+        if len(hashes) == 0:
+            return
+        self.runs.append((hashes, locations))
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= 2 * len(self.runs[-1][0]):
+            (keys_a, locations_a), (keys_b, locations_b) = self.runs[-2:]
+            keys = np.concatenate([keys_a, keys_b])
+            order = np.argsort(keys, kind='stable')
+            self.runs[-2:] = [(keys[order], np.concatenate([locations_a, locations_b])[order])]
+
+
+class BloomFilter:
+    """Bit array answering 'possibly seen' / 'certainly not seen' for ID hashes, with 'k' probes per ID."""
+
+    def __init__(self, size_bytes, k=4):
+        self.bits = np.zeros(size_bytes, dtype=np.uint8)
+        self.size = np.uint64(size_bytes * 8)
+        self.k = k
+
+    def _positions(self, hashes):
+        # Double hashing: probe i of a hash is h1 + i * h2
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        return [(hashes + np.uint64(i) * h2) % self.size for i in range(self.k)]
+
+    def contains(self, hashes):
+        found = np.ones(len(hashes), dtype=bool)
+        for positions in self._positions(hashes):
+            found &= ((self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1) == 1
+        return found
+
+    def add(self, hashes):
+        for positions in self._positions(hashes):
+            np.bitwise_or.at(self.bits, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+
+def candidate_hashes(file_paths, column, bloom_bytes, chunksize=CHUNK_SIZE):
+    """
+    Pre-pass: return the sorted hashes of the IDs that may occur more than once.
+
+    Every ID goes through a Bloom filter; the IDs the filter reports as already seen
+    (real duplicates plus a few false positives) are the only ones the exact pass tracks.
+    """
+    bloom = BloomFilter(bloom_bytes)
+    candidates = []
+    for path in file_paths:
+        for first_row, ids in read_ids(path, column, chunksize):
+            hashes, present, values = hash_ids(ids)
+            unique, counts = np.unique(hashes, return_counts=True)
+            candidates.append(unique[bloom.contains(unique) | (counts > 1)])
+            bloom.add(unique)
+    return np.unique(np.concatenate(candidates)) if candidates else np.zeros(0, dtype=np.uint64)
+
+
+def find_duplicates(file_paths, column, chunksize=CHUNK_SIZE, candidates=None):
+    """
+    Find the IDs that occur more than once in any of the files, in a single pass.
+
+    Parameters:
+    file_paths: CSV, TSV or Excel files to scan.
+    column: Column holding the IDs.
+    chunksize: Rows of CSV/TSV read at a time.
+    candidates: Sorted hashes from candidate_hashes; when given, only these IDs are tracked.
+
+    Returns:
+    DataFrame with one row per occurrence of a duplicated ID (columns ID, File, Row),
+    sorted by ID and then by position in the input files.
+    """
+    table = IdTable()
+    reported = set()  # Hashes of the IDs already known to be duplicated
+    found_ids, found_locations = [], []
+
+    for file_number, path in enumerate(file_paths):
+        for first_row, ids in read_ids(path, column, chunksize):
+            hashes, present, values = hash_ids(ids)
+            locations = (np.int64(file_number) << ROW_BITS) + first_row + present.astype(np.int64)
+            if candidates is not None:
+                positions = np.minimum(np.searchsorted(candidates, hashes), max(len(candidates) - 1, 0))
+                keep = candidates[positions] == hashes if len(candidates) else np.zeros(len(hashes), dtype=bool)
+                hashes, locations, values = hashes[keep], locations[keep], values[keep]
+
+            # First occurrence of every distinct hash of the block, and whether it was seen before
+            unique, first, inverse, counts = np.unique(hashes, return_index=True, return_inverse=True, return_counts=True)
+            seen, previous = table.lookup(unique)
+            duplicated = seen | (counts > 1)
+
+            # Every occurrence, in this block, of the IDs seen before or repeated inside the block
+            rows = np.flatnonzero(duplicated[inverse])
+            found_ids.extend(values[rows])
+            found_locations.extend(locations[rows])
+
+            # The first occurrence, seen in an earlier block, of the IDs that just became duplicated
+            for number in np.flatnonzero(seen):
+                if int(unique[number]) not in reported:
+                    found_ids.append(values[first[number]])
+                    found_locations.append(previous[number])
+            reported.update(unique[duplicated].tolist())
+
+            table.add(unique[~seen], locations[first[~seen]])
+
+    report = pd.DataFrame({
+        'ID': found_ids,
+        'File': [file_paths[location >> ROW_BITS] for location in found_locations],
+        'Row': [int(location & ((1 << ROW_BITS) - 1)) for location in found_locations],
+        '_order': pd.Series(found_locations, dtype=np.int64),
+    })
+    return report.sort_values(['ID', '_order'], kind='stable').drop(columns='_order').reset_index(drop=True)
+
+
+def main():
+
+    # Set up the argument parser with a description and default formatting
+    parser = argparse.ArgumentParser(description='Find IDs repeated within or across submission files', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--input', type=str, nargs='+', help='CSV, TSV or Excel files to scan', default=['gisaid_epiflu_isolates.xls'])
+    parser.add_argument('--column', type=str, help='Column holding the IDs', default='CEVIVAS_ID')
+    parser.add_argument('--output', type=str, help='TSV report with the file and row of every occurrence of a duplicated ID', default='duplicated_ids.tsv')
+    parser.add_argument('--chunksize', type=int, help='Rows of CSV/TSV read at a time', default=CHUNK_SIZE)
+    parser.add_argument('--bloom-mb', type=float, help='Run a Bloom-filter pre-pass of this size (MB) so the exact pass only tracks possible duplicates', default=None)
+    args = parser.parse_args()
 
-# Load data from an Excel file into a DataFrame
-df = pd.read_excel('gisaid_epiflu_isolates.xls')
+    candidates = None
+    if args.bloom_mb:
+        candidates = candidate_hashes(args.input, args.column, int(args.bloom_mb * 2 ** 20), args.chunksize)
+        print(f"{len(candidates)} candidate duplicated IDs after the Bloom-filter pre-pass")
 
-# Identify duplicate entries in the 'CEVIVAS_ID' column
-duplicados = df[df.duplicated('CEVIVAS_ID', keep=False)]
-# 'keep=False' marks all duplicates as True, including the first occurrence
+    # Identify duplicate entries in the ID column of all the files
+    duplicados = find_duplicates(args.input, args.column, args.chunksize, candidates)
 
-# Extract unique duplicated 'CEVIVAS_ID' values
-duplicados_cevivas_id = duplicados['CEVIVAS_ID'].unique()
+    # Print the duplicated IDs
+    print(f"Duplicated strings in the '{args.column}' column:")
+    for item in duplicados['ID'].unique():
+        print(item)
 
-# Print the duplicated 'CEVIVAS_ID' values
-print("Duplicated strings in the 'CEVIVAS_ID' column:")
-for item in duplicados_cevivas_id:
-    print(item)
+    # Print the files and rows containing duplicate IDs
+    print(f"Rows containing duplicates in the '{args.column}' column:")
+    print(duplicados.to_string(index=False))
+    duplicados.to_csv(args.output, sep='\t', index=False)
 
-# Print the rows containing duplicate 'CEVIVAS_ID' values
-print("Rows containing duplicates in the 'CEVIVAS_ID' column:")
-display(duplicados)
+if __name__ == "__main__":
+    main()
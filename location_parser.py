@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+# Names given to the parts of a GISAID 'Location' string, e.g.
+# 'South America / Brazil / Bahia / Salvador'
+LOCATION_LEVELS = ['Continent', 'Country', 'State', 'City', 'District']
+
+
+def split_location(location):
+    """Split one Location string on '/' into a tuple of its parts, kept as they are."""
+    return tuple(str(location).split('/'))
+
+
+def parse_locations(locations, levels=LOCATION_LEVELS, title_levels=('Continent',), strip_levels=('Continent',)):
+    """
+    Split a Series of GISAID Location strings into categorical hierarchy columns.
+
+    Each distinct string is parsed only once per call, and the result is broadcast back
+    to the rows through integer codes. The returned columns are pandas Categoricals, so
+    grouping and filtering on them compares ints, not strings. As with
+    Series.str.split('/', expand=True), the parts keep their surrounding spaces unless
+    their level is in 'strip_levels', and parts missing from a shorter string are NaN.
+
+    Parameters:
+    locations: Series of strings such as 'South America / Brazil / Bahia'.
+    levels: Names of the columns for the first, second, ... part of the string.
+    title_levels: Levels whose values are title-cased (e.g. 'south america' -> 'South America').
+    strip_levels: Levels whose values are stripped of surrounding spaces.
+
+    Returns:
+    DataFrame with one categorical column per level, aligned with 'locations'.
+    """
+    codes, uniques = pd.factorize(locations)
+    parts = [split_location(location) for location in uniques]
+
+    columns = {}
+    for number, level in enumerate(levels):
+        values = [p[number] if number < len(p) else None for p in parts]
+        if level in strip_levels:
+            values = [value.strip() if value is not None else None for value in values]
+        if level in title_levels:
+            values = [value.title() if value is not None else None for value in values]
+
+        # Intern the values of this level, then map every row to its code through the
+        # code of its Location string (-1 stays -1, i.e. missing)
+        level_codes, categories = pd.factorize(pd.Series(values, dtype=object))
+        row_codes = np.where(codes >= 0, level_codes[codes] if len(level_codes) else -1, -1)
+        columns[level] = pd.Categorical.from_codes(row_codes, categories=categories)
+    return pd.DataFrame(columns, index=locations.index)
@@ -0,0 +1,208 @@
+import os
+import mmap
+import struct
+import array
+import bisect
+import hashlib
+
+import numpy as np
+
+# File layout of a mapping store (all integers are native uint64):
+#   header: magic, number of entries, size and mtime_ns of the TSV it was built from
+#   hashes[n]: 64-bit hash of every key, sorted
+#   key_offsets[n + 1], value_offsets[n + 1]: where each key / value starts in its blob
+#   keys blob, values blob
+MAGIC = b'RENMAP01'
+HEADER = struct.Struct('=8sQQQ')
+
+# Entries whose bytes are copied together while building a store
+COPY_BLOCK = 1 << 16
+
+
+def key_hash(key):
+    """64-bit hash of a key (bytes), the order of the entries in the store."""
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def read_pairs(path):
+    """Yield the (old name, new name) pairs, as bytes, of a two-column TSV."""
+    with open(path, "rb") as list_file:
+        # Iterate over each line in the file
+        for line in list_file:
+            aux = line.rstrip().split(b"\t")  # Split the line by tab character
+            if len(aux) >= 2:
+                yield aux[0], aux[1]
+
+
+def _scan_pairs(list_path):
+    """
+    Locate the pairs of a two-column TSV without keeping their bytes.
+
+    Returns numpy arrays with, for every pair in file order, the hash of the key, the
+    position of the line (where the key starts; the value follows the first tab) and
+    the lengths of the key and of the value.
+    """
+    hashes, starts = array.array('Q'), array.array('Q')
+    key_lengths, value_lengths = array.array('Q'), array.array('Q')
+    position = 0
+    with open(list_path, "rb") as list_file:
+        for line in list_file:
+            aux = line.rstrip().split(b"\t")
+            if len(aux) >= 2:
+                hashes.append(key_hash(aux[0]))
+                starts.append(position)
+                key_lengths.append(len(aux[0]))
+                value_lengths.append(len(aux[1]))
+            position += len(line)
+    return tuple(np.frombuffer(column, dtype=np.uint64) if len(column) else np.zeros(0, dtype=np.uint64)
+                 for column in (hashes, starts, key_lengths, value_lengths))
+
+
+def build_store(list_path, store_path):
+    """
+    Convert a two-column TSV into a mapping store file.
+
+    The TSV is scanned once into arrays of key hashes, positions and lengths (no
+    dictionary or lists of keys and values), the entries are put in hash order with a
+    stable sort and the key and value bytes are then copied from the memory-mapped TSV
+    straight into the store. As with a dictionary, the last line wins when a key
+    appears more than once. The store is written to a temporary file and moved into
+    place, so readers never see a partial store.
+    """
+    hashes, starts, key_lengths, value_lengths = _scan_pairs(list_path)
+    order = np.argsort(hashes, kind='stable')
+
+    with open(list_path, "rb") as list_file:
+        source = mmap.mmap(list_file.fileno(), 0, access=mmap.ACCESS_READ) if starts.size else b''
+        try:
+            def key_of(number):
+                return source[starts[number]:starts[number] + key_lengths[number]]
+
+            # Keep the last occurrence of every key. Repeated keys share a hash, so only runs
+            # of equal hashes (file order within each run) need their keys compared
+            sorted_hashes = hashes[order]
+            repeated = np.flatnonzero(sorted_hashes[1:] == sorted_hashes[:-1])
+            if repeated.size:
+                keep = np.ones(len(order), dtype=bool)
+                run_starts = repeated[np.r_[True, repeated[1:] != repeated[:-1] + 1]]
+                for run_start in run_starts:
+                    run_end = run_start + 1
+                    while run_end < len(order) and sorted_hashes[run_end] == sorted_hashes[run_start]:
+                        run_end += 1
+                    last = {key_of(order[position]): position for position in range(run_start, run_end)}
+                    keep[run_start:run_end] = False
+                    keep[sorted(last.values())] = True
+                order = order[keep]
+
+            def offsets(lengths):
+                return np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(lengths[order], dtype=np.uint64)])
+
+            stat = os.stat(list_path)
+            with open(store_path + '.tmp', 'wb') as store_file:
+                store_file.write(HEADER.pack(MAGIC, len(order), stat.st_size, stat.st_mtime_ns))
+                store_file.write(hashes[order].tobytes())
+                store_file.write(offsets(key_lengths).tobytes())
+                store_file.write(offsets(value_lengths).tobytes())
+                # Key bytes, then value bytes, copied a block of entries at a time
+                for value_pass in (False, True):
+                    for block in range(0, len(order), COPY_BLOCK):
+                        numbers = order[block:block + COPY_BLOCK]
+                        block_starts = starts[numbers] + (key_lengths[numbers] + 1 if value_pass else 0)
+                        block_ends = block_starts + (value_lengths if value_pass else key_lengths)[numbers]
+                        for start, end in zip(block_starts.tolist(), block_ends.tolist()):
+                            store_file.write(source[start:end])
+        finally:
+            if starts.size:
+                source.close()
+    os.replace(store_path + '.tmp', store_path)
+
+
+class MappingStore:
+    """
+    Read-only key -> value table (bytes -> bytes) memory-mapped from a store file.
+
+    Nothing is loaded up front: a lookup hashes the key, binary-searches the sorted
+    hash array and compares the key bytes, touching a few pages of the file. The
+    operating system keeps the pages that are used in its cache, shared between runs.
+    It supports the dictionary operations rename.py needs: get, [], in and len.
+    """
+
+    def __init__(self, store_path):
+        with open(store_path, 'rb') as store_file:
+            self._mmap = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._size, self.source_size, self.source_mtime_ns = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{store_path} is not a mapping store")
+
+        n = self._size
+        view = memoryview(self._mmap)
+        start = HEADER.size
+        self._hashes = view[start:start + 8 * n].cast('Q')
+        start += 8 * n
+        self._key_offsets = view[start:start + 8 * (n + 1)].cast('Q')
+        start += 8 * (n + 1)
+        self._value_offsets = view[start:start + 8 * (n + 1)].cast('Q')
+        self._keys_start = start + 8 * (n + 1)
+        self._values_start = self._keys_start + self._key_offsets[n]
+        view.release()
+
+    def __len__(self):
+        return self._size
+
+    def _find(self, key):
+        """Return the position of 'key' in the store, or -1."""
+        hashed = key_hash(key)
+        position = bisect.bisect_left(self._hashes, hashed)
+        # Entries with the same hash are next to each other; compare the keys themselves
+        while position < self._size and self._hashes[position] == hashed:
+            start = self._keys_start + self._key_offsets[position]
+            end = self._keys_start + self._key_offsets[position + 1]
+            if self._mmap[start:end] == key:
+                return position
+            position += 1
+        return -1
+
+    def get(self, key, default=None):
+        position = self._find(bytes(key))
+        if position == -1:
+            return default
+        return self._mmap[self._values_start + self._value_offsets[position]:self._values_start + self._value_offsets[position + 1]]
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._find(bytes(key)) != -1
+
+    def close(self):
+        for view in (self._hashes, self._key_offsets, self._value_offsets):
+            view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_mapping(list_path, store_path=None):
+    """
+    Open the mapping store of a two-column TSV, building it first if needed.
+
+    The store lives next to the TSV ('<list>.map') unless 'store_path' is given. It is
+    rebuilt only when the TSV's size or modification time differs from the ones
+    recorded in the store, so a list is converted once and reused by later runs.
+    """
+    store_path = store_path or list_path + '.map'
+    stat = os.stat(list_path)
+    if os.path.exists(store_path):
+        store = MappingStore(store_path)
+        if (store.source_size, store.source_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            return store
+        store.close()
+    build_store(list_path, store_path)
+    return MappingStore(store_path)
@@ -0,0 +1,145 @@
+import os
+import glob
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pandas as pd
+
+# Directory shared by every script that loads GISAID/EpiFlu metadata through this module;
+# can be moved with the METADATA_CACHE_DIR environment variable
+DEFAULT_CACHE_DIR = os.environ.get('METADATA_CACHE_DIR', os.path.expanduser('~/.cache/gisaid_metadata'))
+
+# Parquet is used when pyarrow is installed; otherwise the tables are pickled
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+
+def read_table(path, **read_kwargs):
+    """Read a spreadsheet or delimited text file with pandas, chosen by its extension."""
+    if path.endswith(('.xls', '.xlsx')):
+        return pd.read_excel(path, **read_kwargs)
+    if path.endswith('.tsv'):
+        read_kwargs.setdefault('sep', '\t')
+    return pd.read_csv(path, **read_kwargs)
+
+
+def iter_table(path, chunksize, cache_dir=DEFAULT_CACHE_DIR, **read_kwargs):
+    """
+    Yield a metadata table in blocks of rows, without loading text files whole.
+
+    CSV/TSV files are streamed with pd.read_csv(chunksize=...). Excel files cannot be
+    streamed: they are loaded once through the cache (pass usecols=[...] to parse only
+    the needed columns) and yielded as a single block.
+    """
+    if path.endswith(('.xls', '.xlsx')):
+        yield load_table(path, cache_dir=cache_dir, **read_kwargs)
+        return
+    if path.endswith('.tsv'):
+        read_kwargs.setdefault('sep', '\t')
+    yield from pd.read_csv(path, chunksize=chunksize, **read_kwargs)
+
+
+def _cache_prefix(path, read_kwargs):
+    """Return the part of the cache file name that identifies a source file and how it is read."""
+    key = f'{os.path.abspath(path)}|{sorted(read_kwargs.items())!r}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _cache_path(path, read_kwargs, cache_dir):
+    """Return where the cached copy of the current version of 'path' lives."""
+    stat = os.stat(path)
+    prefix = _cache_prefix(path, read_kwargs)
+    return os.path.join(cache_dir, f'{prefix}-{stat.st_size}-{stat.st_mtime_ns}')
+
+
+def _write_cache(df, cache_path):
+    """Store a table in the cache, falling back to pickle for columns Parquet cannot hold."""
+    if CACHE_FORMAT == 'parquet':
+        try:
+            df.to_parquet(cache_path + '.parquet.tmp', index=False)
+            os.replace(cache_path + '.parquet.tmp', cache_path + '.parquet')
+            return
+        except (ValueError, TypeError, ImportError, pyarrow.ArrowException):
+            # Mixed-type columns coming from Excel cannot always be stored as Parquet
+            if os.path.exists(cache_path + '.parquet.tmp'):
+                os.remove(cache_path + '.parquet.tmp')
+    df.to_pickle(cache_path + '.pkl.tmp')
+    os.replace(cache_path + '.pkl.tmp', cache_path + '.pkl')
+
+
+def _read_cache(cache_path):
+    """Return the cached table stored under 'cache_path', or None if there is none."""
+    if os.path.exists(cache_path + '.parquet'):
+        return pd.read_parquet(cache_path + '.parquet')
+    if os.path.exists(cache_path + '.pkl'):
+        return pd.read_pickle(cache_path + '.pkl')
+    return None
+
+
+def load_table(path, cache_dir=DEFAULT_CACHE_DIR, **read_kwargs):
+    """
+    Load one metadata table, from the cache if the file has not changed since it was cached.
+
+    A source file is identified by its absolute path, its size, its modification time
+    and the keyword arguments passed to the pandas reader. When a file changes, it is
+    parsed again and the outdated copy is removed from the cache.
+
+    Parameters:
+    path: .xls/.xlsx, .csv or .tsv file to load.
+    cache_dir: Directory holding the cached tables.
+    read_kwargs: Extra arguments for pd.read_excel / pd.read_csv, e.g. usecols=[...]
+                 to parse only the needed columns.
+
+    Returns:
+    df: The table as a DataFrame.
+    """
+    cache_path = _cache_path(path, read_kwargs, cache_dir)
+    df = _read_cache(cache_path)
+    if df is not None:
+        return df
+
+    df = read_table(path, **read_kwargs)
+
+    # Drop the copies of older versions of the same file before storing the new one
+    os.makedirs(cache_dir, exist_ok=True)
+    for old_path in glob.glob(os.path.join(cache_dir, _cache_prefix(path, read_kwargs) + '-*')):
+        os.remove(old_path)
+    _write_cache(df, cache_path)
+    return df
+
+
+def load_metadata(file_paths, cache_dir=DEFAULT_CACHE_DIR, workers=1, **read_kwargs):
+    """
+    Load and concatenate several metadata exports, parsing only the new or modified ones.
+
+    Parsing spreadsheets is CPU-bound, so with more than one worker the files missing
+    from the cache are parsed on a process pool. Passing usecols=[...] restricts both
+    the parsing and the cache to the needed columns.
+
+    Parameters:
+    file_paths: Files to load, in the order their rows should appear.
+    cache_dir: Directory holding the cached tables.
+    workers: Number of processes parsing the files that are not cached.
+    read_kwargs: Extra arguments for pd.read_excel / pd.read_csv.
+
+    Returns:
+    combined_df: All tables concatenated with a fresh index.
+    """
+    dfs = [_read_cache(_cache_path(path, read_kwargs, cache_dir)) for path in file_paths]
+    missing = [number for number, df in enumerate(dfs) if df is None]
+
+    load = partial(load_table, cache_dir=cache_dir, **read_kwargs)
+    if workers > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(min(workers, len(missing))) as pool:
+            for number, df in zip(missing, pool.map(load, [file_paths[number] for number in missing])):
+                dfs[number] = df
+    else:
+        for number in missing:
+            dfs[number] = load(file_paths[number])
+
+    # Build the combined table in one concatenation
+    return pd.concat(dfs, ignore_index=True)
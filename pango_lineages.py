@@ -0,0 +1,138 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+
+def load_aliases(path):
+    """
+    Read a local copy of the pango-designation alias file (alias_key.json).
+
+    The file maps every alias prefix to the lineage it stands for ("JN": "B.1.1.529.2.86.1",
+    "A" and "B" to ""); recombinant prefixes map to the list of their parents and are kept
+    as roots of their own.
+    """
+    with open(path) as alias_file:
+        aliases = json.load(alias_file)
+    return {alias: full for alias, full in aliases.items() if isinstance(full, str) and full}
+
+
+class LineageTree:
+    """
+    Parent/ancestor queries and collapsing of Pango lineage names, memoized per name.
+
+    Names are expanded through the alias table (KP.2 -> B.1.1.529.2.86.1.1.11.1.2) so that
+    ancestry follows the real hierarchy across aliases, and compressed back to their
+    usual short form for display. Every name is expanded, and every (name, rule) pair
+    collapsed, only once; collapse_column applies this to the distinct labels of a
+    column and maps the rows through integer codes. Depths count the levels of the
+    expanded name, so collapsing follows the hierarchy across aliases too.
+    """
+
+    def __init__(self, aliases=None):
+        self.aliases = aliases or {}
+        # Full lineage -> alias, to write expanded names in short form again
+        self._short = {full: alias for alias, full in self.aliases.items()}
+        self._expanded = {}
+        self._watchlists = {}  # Watch-list as given -> frozenset of expanded names
+        self._collapsed = {}  # (depth, watched, other) -> {name: group}
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_aliases(path))
+
+    def expand(self, name):
+        """Unaliased name: the alias prefix replaced by the lineage it stands for."""
+        if name not in self._expanded:
+            prefix, _, rest = name.partition('.')
+            full = self.aliases.get(prefix)
+            self._expanded[name] = f'{full}.{rest}' if full and rest else (full or name)
+        return self._expanded[name]
+
+    def compress(self, full):
+        """Short form of an expanded name, through the longest alias that covers it."""
+        parts = full.split('.')
+        for size in range(len(parts) - 1, 0, -1):
+            alias = self._short.get('.'.join(parts[:size]))
+            if alias:
+                return '.'.join([alias] + parts[size:])
+        return full
+
+    def ancestors(self, name):
+        """The lineage itself and all its ancestors, closest first, in short form."""
+        parts = self.expand(name).split('.')
+        return [self.compress('.'.join(parts[:size])) for size in range(len(parts), 0, -1)]
+
+    def parent(self, name):
+        """Direct parent in short form (None for a root such as B or XBB)."""
+        ancestors = self.ancestors(name)
+        return ancestors[1] if len(ancestors) > 1 else None
+
+    def _watched(self, watchlist):
+        """Expanded names of a watch-list (a trailing '*' is ignored), normalised once per list."""
+        if not watchlist:
+            return None
+        key = tuple(watchlist)
+        if key not in self._watchlists:
+            self._watchlists[key] = frozenset(self.expand(lineage.rstrip('*')) for lineage in watchlist)
+        return self._watchlists[key]
+
+    def collapse(self, name, depth=None, watchlist=None, other='Other'):
+        """
+        Collapse a lineage name to a coarser group.
+
+        Parameters:
+        name: Lineage name (e.g. "KP.2.3").
+        depth: Number of numbered levels of the expanded name kept, written in short form
+               again (depth 1: "EG.5.1" = XBB.1.9.2.5.1 -> "XBB.1"; depth 4: "KP.2.3" -> "BA.2").
+        watchlist: Lineages to report (a trailing '*' is ignored): every name goes to its
+                   closest ancestor in the list, or to 'other' when it has none.
+        other: Group of the names outside the watch-list.
+
+        Returns:
+        The group name.
+        """
+        return self._collapse(name, self._rule(depth, watchlist, other))
+
+    def _rule(self, depth, watchlist, other):
+        """Memo of the collapsed names of one (depth, watch-list, other) rule."""
+        key = (depth, self._watched(watchlist), other)
+        return key, self._collapsed.setdefault(key, {})
+
+    def _collapse(self, name, rule):
+        (depth, watched, other), memo = rule
+        if name not in memo:
+            parts = self.expand(name).split('.')
+            if watched is not None:
+                group = other
+                for size in range(len(parts), 0, -1):
+                    prefix = '.'.join(parts[:size])
+                    if prefix in watched:
+                        group = self.compress(prefix)
+                        break
+            elif depth is not None:
+                group = self.compress('.'.join(parts[:depth + 1])) if len(parts) > depth + 1 else name
+            else:
+                group = name
+            memo[name] = group
+        return memo[name]
+
+    def collapse_column(self, values, depth=None, watchlist=None, other='Other'):
+        """
+        Collapse a whole column of lineage names, resolving each distinct name only once.
+
+        Missing values stay missing. Returns a Series aligned with 'values'.
+        """
+        rule = self._rule(depth, watchlist, other)
+        values = pd.Series(values)
+        codes, names = pd.factorize(values)
+        groups = pd.Index([self._collapse(str(name), rule) for name in names] + [np.nan])
+        return pd.Series(groups.take(codes), index=values.index, name=values.name)
+
+    def collapse_table(self, table, depth=None, watchlist=None, other='Other'):
+        """Add up the lineage columns of a count table (or the entries of a count Series) by group."""
+        if isinstance(table, pd.Series):
+            groups = self.collapse_column(table.index.to_series(), depth, watchlist, other)
+            return table.groupby(groups.to_numpy(), sort=False).sum().sort_values(ascending=False, kind='stable')
+        groups = self.collapse_column(table.columns.to_series(), depth, watchlist, other)
+        return table.T.groupby(groups.to_numpy()).sum().T
@@ -1,59 +1,168 @@
 import os
 import argparse
 
+from fasta_io import open_fasta, find_header
+from mapping_store import read_pairs, open_mapping
+
+# Size of the blocks read from the input FASTA at a time (8 MiB)
+BLOCK_SIZE = 8 * 1024 * 1024
+
+# What to do with a header that is not in the --list file:
+#   error: stop with a KeyError; keep: write the header unchanged; drop: leave the record out
+MISSING_POLICIES = ('error', 'keep', 'drop')
+
+# Whitespace that rstrip() removes from the end of a line (besides the newline). Lines
+# ending in it (CRLF files, trailing spaces) are stripped before they are written, as the
+# line-by-line loop did; blocks without any are copied as they are
+_TRAILING_SPACE = (b"\r", b" ", b"\t", b"\x0b", b"\x0c")
+
+
+def _has_trailing_space(data):
+    """Tell whether a line of 'data' ends in whitespace, looking for the single bytes first (fast) and only then for whitespace before a newline."""
+    return b"\r" in data or any(space in data and space + b"\n" in data for space in _TRAILING_SPACE[1:])
+
+
+def _write_lines(output_file, view, start, stop, strip):
+    """Write the complete lines view[start:stop], with their trailing whitespace removed if 'strip'."""
+    if not strip:
+        output_file.write(view[start:stop])
+    elif start < stop:
+        lines = bytes(view[start:stop]).split(b"\n")[:-1]
+        output_file.write(b"\n".join(line.rstrip() for line in lines) + b"\n")
+
+
+def _rewrite_block(data, stop, output_file, pattern, missing='error', dropping=False):
+    """
+    Rewrite the headers of data[:stop], which holds only complete lines, and write it out.
+
+    Everything between two headers (the sequence lines) is written with a single
+    slice, so only the header lines are ever looked at, unless the block has lines
+    with trailing whitespace (e.g. CRLF line endings): then the sequence lines are
+    stripped and end in a plain newline. 'dropping' tells whether the
+    record the block starts in is being left out. Returns the number of headers
+    rewritten, the number of headers missing from 'pattern' and whether the last
+    record of the block is being left out.
+    """
+    count = 0
+    missed = 0
+    pos = 0
+    view = memoryview(data)  # Slices of a memoryview are written without copying
+    strip = _has_trailing_space(data)
+
+    start = find_header(data, 0, stop)
+    while start != -1:
+        # Copy the sequence lines that precede this header
+        if not dropping:
+            _write_lines(output_file, view, pos, start, strip)
+
+        # data[:stop] always ends with a newline, so every header line is complete
+        end = data.find(b"\n", start, stop)
+        name = data[start + 1:end].rstrip()
+        new_name = pattern.get(name)
+        dropping = False
+        if new_name is not None:
+            output_file.write(b">" + new_name + b"\n")
+            count += 1
+        elif missing == 'error':
+            raise KeyError(f"Header '{name.decode()}' not found in the --list file")
+        else:
+            missed += 1
+            if missing == 'keep':
+                output_file.write(b">" + name + b"\n")
+            else:
+                dropping = True
+
+        # Look for the next header after this line
+        pos = end + 1
+        start = find_header(data, pos, stop)
+
+    # Copy the remaining sequence lines of the block
+    if not dropping:
+        _write_lines(output_file, view, pos, stop, strip)
+    return count, missed, dropping
+
+
+def rewrite_headers(input_file, output_file, pattern, block_size=BLOCK_SIZE, missing='error'):
+    """
+    Stream a FASTA file in large blocks, replacing each header by its value in 'pattern'.
+
+    Parameters:
+    input_file: Binary file object to read the FASTA from.
+    output_file: Binary file object to write the renamed FASTA to.
+    pattern: Dictionary or MappingStore mapping old header names to new ones (both as bytes).
+    block_size: Number of bytes read from 'input_file' at a time.
+    missing: Policy for headers not in 'pattern', one of MISSING_POLICIES.
+
+    Returns:
+    count: The number of headers rewritten.
+    missed: The number of headers not found in 'pattern' (kept or dropped).
+    """
+    count = 0
+    missed = 0
+    dropping = False  # Whether the record being copied is left out
+    carry = b""  # Incomplete last line of the previous block
+
+    while True:
+        block = input_file.read(block_size)
+        if not block:
+            break
+        data = carry + block if carry else block
+
+        # Only rewrite complete lines, keep the rest for the next block
+        cut = data.rfind(b"\n") + 1
+        if cut == 0:
+            carry = data
+            continue
+        carry = data[cut:]
+        renamed, not_found, dropping = _rewrite_block(data, cut, output_file, pattern, missing, dropping)
+        count += renamed
+        missed += not_found
+
+    # The last line may not end with a newline; terminate it like the other lines
+    if carry:
+        carry += b"\n"
+        renamed, not_found, dropping = _rewrite_block(carry, len(carry), output_file, pattern, missing, dropping)
+        count += renamed
+        missed += not_found
+    return count, missed
+
+
+def load_pattern(path):
+    """Read a two-column TSV (old name, new name) into a dictionary of bytes."""
+    return dict(read_pairs(path))
+
+
 def main():
-    
+
     # Set up the argument parser with a description and default formatting
     parser = argparse.ArgumentParser(description='rename', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    
+
     # Define the command-line arguments required for the script
-    parser.add_argument('--input', required=True, type=str, help='A .csv file with address column', default=None)
-    parser.add_argument('--list', required=True, type=str, help='A .csv file with address column', default=None)
-    parser.add_argument('--output', required=True, type=str, help='Output file name', default=None)
-    
+    parser.add_argument('--input', required=True, type=str, help='FASTA file to rename (plain, .gz or .xz)', default=None)
+    parser.add_argument('--list', required=True, type=str, help='A tab-separated file with old and new header names', default=None)
+    parser.add_argument('--output', required=True, type=str, help='Output file name (plain, .gz or .xz)', default=None)
+    parser.add_argument('--block-size', type=int, help='Number of bytes read from the input at a time', default=BLOCK_SIZE)
+    parser.add_argument('--missing', choices=MISSING_POLICIES, help='What to do with headers not in the --list file: stop, keep them unchanged or drop the record', default='error')
+    parser.add_argument('--store', type=str, help="Memory-mapped mapping store built from --list and reused while the list is unchanged ('<list>.map' by default)", default=None)
+    parser.add_argument('--in-memory', action='store_true', help='Load --list into a dictionary instead of using the mapping store')
+
     # Parse the command-line arguments
     args = parser.parse_args()
-    
+
     # Print the parsed arguments (for debugging purposes)
     print(args)
-    
-    # Initialize an empty dictionary to store the mapping
-    pattern = {}
-
-    # Open the file specified by '--list' argument and read its contents
-    with open(args.list, "r") as list_file:
-        
-        # Iterate over each line in the file
-        for line in list_file:
-            line = line.rstrip()  # Remove trailing whitespace characters
-            aux = line.split("\t")  # Split the line by tab character
-            pattern[aux[0]] = aux[1]  # Populate the dictionary with key-value pairs
-    # Print the dictionary to check its contents
-    print(pattern)
-    
-    # Open the input file specified by '--input' argument for reading
-    with open(args.input) as input_file:
-        # Open the output file specified by '--output' argument for writing
-        output_file = open(args.output, "w")
-        
-        # Iterate over each line in the input file
-        for line in input_file:
-            line = line.rstrip()  # Remove trailing whitespace characters
-
-            # Check if the line contains a '>' character
-            if line.find(">") != -1:
-                # Extract the part after '>'
-                aux = line.split(">")[1]
-                # Write the corresponding value from the dictionary to the output file
-                output_file.write(">" + pattern[aux])
-            else:
-                # Write the line as is to the output file
-                output_file.write(line)
-            # Write a newline character to the output file
-            output_file.write("\n")
 
-        # Close the output file
-        output_file.close()
+    # Load the mapping between old and new header names (the store is built on first use)
+    pattern = load_pattern(args.list) if args.in_memory else open_mapping(args.list, args.store)
+    print(f"{len(pattern)} header mappings loaded from {args.list}")
+
+    # Stream the input into the output, rewriting only the header lines
+    with open_fasta(args.input, "rb") as input_file, open_fasta(args.output, "wb") as output_file:
+        count, missed = rewrite_headers(input_file, output_file, pattern, block_size=args.block_size, missing=args.missing)
+
+    print(f"{count} headers renamed into {os.path.abspath(args.output)}")
+    if missed:
+        print(f"{missed} headers not found in {args.list} were {'kept unchanged' if args.missing == 'keep' else 'dropped'}")
 
 # Ensure that the main function runs if the script is executed directly
 if __name__ == "__main__":
@@ -1,36 +1,206 @@
-from IPython.core.display import display, HTML
-display(HTML("<style>.container { width:100% !important; }</style>"))
-# Adjusts the display width of Jupyter notebooks to 100% of the container width for better visualization
+import os
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
+from location_parser import parse_locations
 
-# Load the spreadsheet
-global_G = pd.read_csv('lineage_AY_43.tsv', sep='\t')
-# Reads a tab-separated values (TSV) file into a DataFrame named 'global_G'
+# Column used to keep only the high-coverage sequences
+COVERAGE_COLUMN = 'Is high coverage?'
 
-# View the header of the DataFrame
-global_G.columns
-# Displays the column names of the DataFrame
 
-# Apply filters to select rows with high coverage
-global_High = (global_G['Is high coverage?'] == True)
-# Creates a boolean Series where True indicates high coverage
-global_High = global_G.iloc[np.where(global_High == True)[0]]
-# Selects rows from 'global_G' where the coverage is high
+def high_coverage_locations(df):
+    """Keep the high-coverage rows and replace 'Location' by its first part (the continent)."""
+    # Apply filters to select rows with high coverage
+    df = df.iloc[np.where(df[COVERAGE_COLUMN] == True)[0]].copy()
+    # Parses each distinct Location string once and keeps the continent
+    df["Location"] = parse_locations(df["Location"])["Continent"]
+    return df
 
-# Split the 'Location' column into two separate columns
-global_High["Location"] = global_High["Location"].str.split("/", n=1, expand=True)
-# Splits the 'Location' column at the first occurrence of '/' into two columns
 
-# Group by 'Location' and sample a fraction of rows
-frac = global_High.groupby('Location', group_keys=False).apply(pd.DataFrame.sample, frac=.02, random_state=1)
-# Groups the DataFrame by 'Location', samples 2% of rows from each group, and ensures reproducibility with a fixed random seed
+def subsample(input_path, frac=.02, random_state=1):
+    """
+    Sample a fraction of the high-coverage rows of every Location, in memory.
 
-# View the quantity of locations
-frac.groupby('Location').size()
-# Displays the size of each group in the sampled DataFrame
+    Parameters:
+    input_path: Lineage TSV exported from GISAID.
+    frac: Fraction of the rows of each Location to keep.
+    random_state: Seed for the sampling, for reproducibility.
 
-# Save the result to a TSV file
-frac.to_csv('result_AY43.tsv', sep='\t', index=False)
-# Saves the sampled DataFrame to a TSV file without including row indices
+    Returns:
+    The sampled rows, grouped by Location.
+    """
+    # Load the spreadsheet
+    global_G = pd.read_csv(input_path, sep='\t')
+    global_High = high_coverage_locations(global_G)
+
+    # Groups the DataFrame by 'Location', samples a fraction of rows from each group, and ensures reproducibility with a fixed random seed
+    # (every group is drawn with its own generator seeded with 'random_state', as groupby().apply(pd.DataFrame.sample)
+    # does, so the selection matches it; the loop keeps the 'Location' column, which apply drops in recent pandas)
+    groups = [group.sample(frac=frac, random_state=random_state) for _, group in global_High.groupby('Location', observed=True)]
+    return pd.concat(groups) if groups else global_High
+
+
+def count_locations(input_path, chunksize):
+    """Count the high-coverage rows of every Location, reading only the two needed columns."""
+    counts = pd.Series(dtype=np.int64)
+    for chunk in pd.read_csv(input_path, sep='\t', usecols=['Location', COVERAGE_COLUMN], chunksize=chunksize):
+        locations = high_coverage_locations(chunk)['Location']
+        counts = counts.add(locations.value_counts(), fill_value=0)
+    return counts.astype(np.int64)
+
+
+def stream_subsample(input_path, frac=.02, random_state=1, chunksize=100_000):
+    """
+    Sample a fraction of the high-coverage rows of every Location without loading the whole TSV.
+
+    A first pass counts the rows of each Location (reading two columns only), which fixes
+    the sample size of each Location to round(frac * count), as in DataFrame.sample.
+    The second pass reads the TSV in chunks and gives every row a random key; each
+    Location keeps the rows with the smallest keys seen so far (a reservoir), which is
+    a uniform sample without replacement. Memory is proportional to the output plus
+    one chunk. The result only depends on 'random_state', not on 'chunksize', but it is
+    not the same sample as the in-memory mode draws.
+
+    Parameters:
+    input_path: Lineage TSV exported from GISAID.
+    frac: Fraction of the rows of each Location to keep.
+    random_state: Seed for the sampling, for reproducibility.
+    chunksize: Number of rows read at a time.
+
+    Returns:
+    The sampled rows, grouped by Location.
+    """
+    targets = np.rint(count_locations(input_path, chunksize) * frac).astype(np.int64)
+    targets = targets[targets > 0]
+    rng = np.random.default_rng(random_state)
+
+    reservoir = None
+    for chunk in pd.read_csv(input_path, sep='\t', chunksize=chunksize):
+        chunk = high_coverage_locations(chunk)
+        chunk["Location"] = chunk["Location"].astype(object)
+        chunk = chunk[chunk["Location"].isin(targets.index)]
+        chunk["_key"] = rng.random(len(chunk))
+
+        # Keep, for every Location, the rows with the smallest keys among the reservoir and the chunk
+        pool = pd.concat([reservoir, chunk]) if reservoir is not None else chunk
+        pool = pool.sort_values("_key", kind="stable")
+        reservoir = pool[pool.groupby("Location").cumcount().to_numpy() < pool["Location"].map(targets).to_numpy()]
+
+    if reservoir is None:
+        return pd.DataFrame()
+    return reservoir.sort_values(["Location", "_key"], kind="stable").drop(columns="_key")
+
+
+def subsample_file(input_path, output_path, frac=.02, random_state=1, chunksize=None):
+    """Subsample one lineage TSV, write the result and return its number of rows per Location."""
+    if chunksize:
+        sample = stream_subsample(input_path, frac=frac, random_state=random_state, chunksize=chunksize)
+    else:
+        sample = subsample(input_path, frac=frac, random_state=random_state)
+    sample.to_csv(output_path, sep='\t', index=False)
+    if sample.empty:
+        return pd.Series(dtype=np.int64)
+    return sample.groupby('Location', observed=True).size()
+
+
+def expand_inputs(patterns):
+    """Turn files, directories (all their .tsv files) and glob patterns into a list of TSV paths."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, '*.tsv'))))
+        elif glob.has_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def output_path_for(input_path, output_dir):
+    """Name the output of one input after its lineage: lineage_AY_43.tsv -> result_AY_43.tsv."""
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    if stem.startswith('lineage_'):
+        stem = stem[len('lineage_'):]
+    return os.path.join(output_dir, f'result_{stem}.tsv')
+
+
+def subsample_batch(input_paths, output_dir, frac=.02, random_state=1, chunksize=None, workers=1):
+    """
+    Subsample many lineage TSVs in one process pool, writing one output per input.
+
+    Every file is sampled with the same settings. The largest files are submitted first
+    so that the workers finish together, and the pool is started only once, so the total
+    time follows the amount of data rather than the number of files. Inputs with the same
+    file name would write the same result, so they raise a ValueError before any work.
+
+    Parameters:
+    input_paths: Lineage TSVs to subsample.
+    output_dir: Directory receiving one result_<lineage>.tsv per input.
+    frac: Fraction of the rows of each Location to keep.
+    random_state: Seed for the sampling, shared by all files.
+    chunksize: Stream every TSV in chunks of this many rows (None loads each file whole).
+    workers: Number of processes.
+
+    Returns:
+    summary: Number of sampled rows per input file (rows) and Location (columns).
+    """
+    output_paths = [output_path_for(path, output_dir) for path in input_paths]
+
+    # Inputs with the same file name (e.g. from different directories) would overwrite each
+    # other's result and share a row of the summary
+    outputs = pd.Series(output_paths)
+    repeated = outputs[outputs.duplicated(keep=False)]
+    if not repeated.empty:
+        clashes = ', '.join(input_paths[number] for number in repeated.index)
+        raise ValueError(f"Inputs with the same output name: {clashes}")
+    os.makedirs(output_dir, exist_ok=True)
+    by_size = sorted(range(len(input_paths)), key=lambda number: os.path.getsize(input_paths[number]), reverse=True)
+
+    counts = [None] * len(input_paths)
+    if workers > 1 and len(input_paths) > 1:
+        with ProcessPoolExecutor(min(workers, len(input_paths))) as pool:
+            futures = {number: pool.submit(subsample_file, input_paths[number], output_paths[number], frac, random_state, chunksize) for number in by_size}
+            for number, future in futures.items():
+                counts[number] = future.result()
+    else:
+        for number in by_size:
+            counts[number] = subsample_file(input_paths[number], output_paths[number], frac, random_state, chunksize)
+
+    # One row per input file, one column per Location, plus the total over all files
+    summary = pd.DataFrame([count.to_dict() for count in counts], index=[os.path.basename(path) for path in input_paths])
+    summary = summary.fillna(0).astype(np.int64).sort_index(axis=1)
+    summary.index.name = 'File'
+    summary.loc['Total'] = summary.sum()
+    return summary
+
+
+def main():
+
+    # Set up the argument parser with a description and default formatting
+    parser = argparse.ArgumentParser(description='Representative subset of a GISAID lineage TSV, sampled by Location', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--input', type=str, nargs='+', help='Lineage TSV exported from GISAID; several files, a directory or a glob run in batch mode', default=['lineage_AY_43.tsv'])
+    parser.add_argument('--output', type=str, help='Output TSV file name (single file mode)', default='result_AY43.tsv')
+    parser.add_argument('--output-dir', type=str, help='Directory for the result_<lineage>.tsv files (batch mode)', default='.')
+    parser.add_argument('--summary', type=str, help='TSV with the number of sampled rows per file and Location (batch mode)', default='summary_locations.tsv')
+    parser.add_argument('--workers', type=int, help='Number of files processed at the same time (batch mode)', default=os.cpu_count() or 1)
+    parser.add_argument('--frac', type=float, help='Fraction of each Location to keep', default=.02)
+    parser.add_argument('--random-state', type=int, help='Seed for the sampling', default=1)
+    parser.add_argument('--chunksize', type=int, help='Stream the TSV in chunks of this many rows (reservoir sampling) instead of loading it whole', default=None)
+    args = parser.parse_args()
+
+    input_paths = expand_inputs(args.input)
+    if len(input_paths) != 1 or input_paths[0] not in args.input:
+        # Batch mode: one output per input and a combined summary of the Location counts
+        summary = subsample_batch(input_paths, args.output_dir, frac=args.frac, random_state=args.random_state, chunksize=args.chunksize, workers=args.workers)
+        print(summary)
+        summary.to_csv(args.summary, sep='\t')
+        return
+
+    # Save the result to a TSV file and view the quantity of locations
+    print(subsample_file(input_paths[0], args.output, frac=args.frac, random_state=args.random_state, chunksize=args.chunksize))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import hashlib
+from array import array
+
+from fasta_io import clean_sequence
+
+# Fraction of DigestSet slots that may be used before the table is doubled
+MAX_LOAD = 2 / 3
+
+
+def sequence_digest(sequence, isolate_id=None):
+    """
+    Return a 64-bit BLAKE2 digest of a sequence, ignoring its line breaks.
+
+    If 'isolate_id' is given it is hashed together with the sequence, so the same
+    sequence under two different isolate IDs gives two different digests.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    if isolate_id is not None:
+        digest.update(isolate_id.encode())
+        digest.update(b"\0")
+    digest.update(clean_sequence(sequence))
+    # 0 marks an empty slot in DigestSet
+    return int.from_bytes(digest.digest(), "little") or 1
+
+
+class DigestSet:
+    """
+    Set of 64-bit digests stored in a flat open-addressing table.
+
+    Each slot takes 8 bytes, so 10 million digests fit in about 128 MB, against
+    more than 1 GB for a Python set of strings.
+    """
+
+    def __init__(self, capacity=1 << 16):
+        size = 1
+        while size < capacity / MAX_LOAD:
+            size *= 2
+        self._table = array("Q", bytes(8 * size))
+        self._mask = size - 1
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _slot(self, digest):
+        """Return the slot holding 'digest', or the empty slot where it would go."""
+        table, mask = self._table, self._mask
+        slot = digest & mask
+        while table[slot] and table[slot] != digest:
+            slot = (slot + 1) & mask  # Linear probing
+        return slot
+
+    def __contains__(self, digest):
+        return self._table[self._slot(digest)] == digest
+
+    def add(self, digest):
+        """Add a non-zero digest; return True if it was not in the set yet."""
+        slot = self._slot(digest)
+        if self._table[slot]:
+            return False
+        self._table[slot] = digest
+        self._count += 1
+        if self._count > MAX_LOAD * len(self._table):
+            self._grow()
+        return True
+
+    def _grow(self):
+        """Double the table and re-insert every digest."""
+        old_table = self._table
+        self._table = array("Q", bytes(16 * len(old_table)))
+        self._mask = len(self._table) - 1
+        for digest in old_table:
+            if digest:
+                self._table[self._slot(digest)] = digest
+
+
+class SequenceDeduplicator:
+    """
+    Keep the first occurrence of each sequence seen while streaming FASTA records.
+
+    Every later occurrence is dropped and, if 'report_path' is given, written to a TSV
+    report with its isolate ID, source file and digest. With 'include_isolate_id' a
+    record is only a duplicate when both its sequence and its isolate ID were seen.
+    """
+
+    def __init__(self, report_path=None, include_isolate_id=False, capacity=1 << 16):
+        self.include_isolate_id = include_isolate_id
+        self.seen = DigestSet(capacity)
+        self.dropped = 0
+        self._report = None
+        if report_path is not None:
+            self._report = open(report_path, "w")
+            self._report.write("Isolate_Id\tFile\tDigest\n")
+
+    def digest(self, isolate_id, sequence):
+        """Return the digest of a record under this deduplicator's key."""
+        return sequence_digest(sequence, isolate_id if self.include_isolate_id else None)
+
+    def add(self, digest, isolate_id, source):
+        """Record a digest computed elsewhere; return True if the record should be kept."""
+        if self.seen.add(digest):
+            return True
+        self.dropped += 1
+        if self._report is not None:
+            self._report.write(f"{isolate_id}\t{source}\t{digest:016x}\n")
+        return False
+
+    def keep(self, isolate_id, sequence, source):
+        """Return True if the record is the first with this key, False for a duplicate."""
+        return self.add(self.digest(isolate_id, sequence), isolate_id, source)
+
+    def close(self):
+        if self._report is not None:
+            self._report.close()
+            self._report = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
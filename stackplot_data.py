@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+
+from metadata_cache import iter_table
+
+# How align_frame fills the rows it adds:
+#   zero: with 0; ffill: copy of the previous existing row (the next one for leading rows);
+#   bfill: copy of the next existing row (the previous one for trailing rows)
+FILL_METHODS = ('zero', 'ffill', 'bfill')
+
+
+def align_frame(df, index=None, columns=None, fill='zero'):
+    """
+    Reindex a count/frequency table to the given rows and columns in a single operation.
+
+    Rows and columns missing from 'df' are added at once (no row-by-row inserts), rows
+    and columns not listed are dropped, and the remaining holes are filled with 0.
+    With 'ffill' or 'bfill' each added row is a copy of the nearest row that 'df'
+    already had, found with array arithmetic over the positions.
+
+    Parameters:
+    df: Table indexed by period (rows) and lineage/clade (columns).
+    index: Rows of the result, in order (the rows of 'df' when None).
+    columns: Columns of the result, in order (the columns of 'df' when None).
+    fill: One of FILL_METHODS, for the added rows.
+
+    Returns:
+    The aligned table, without NaN.
+    """
+    if fill not in FILL_METHODS:
+        raise ValueError(f"fill must be one of {FILL_METHODS}, not {fill!r}")
+    index = df.index if index is None else pd.Index(index)
+    columns = df.columns if columns is None else pd.Index(columns)
+    result = df.reindex(index=index, columns=columns)
+
+    present = index.isin(df.index)
+    if fill != 'zero' and present.any() and not present.all():
+        positions = np.arange(len(index))
+        # Position of the closest existing row at or before / at or after every row
+        previous = np.maximum.accumulate(np.where(present, positions, -1))
+        following = np.minimum.accumulate(np.where(present, positions, len(index))[::-1])[::-1]
+        if fill == 'ffill':
+            source = np.where(previous >= 0, previous, following)
+        else:
+            source = np.where(following < len(index), following, previous)
+        result = result.iloc[source].set_axis(index, axis=0)
+    return result.fillna(0)
+
+
+def complete_dataframe(df1=None, df2=None, with_nonzero=False, fill=None):
+    """
+    Ensures that df2 has the same columns and rows as df1.
+
+    Rows and columns of df1 missing from df2 are added (df2 keeps its own extra ones),
+    the rows are sorted and NaN values are replaced with 0. If with_nonzero is True,
+    added rows are copies of the previous row of df2 (the next one for the first row).
+
+    Parameters:
+    df1: The first DataFrame, serving as the reference.
+    df2: The second DataFrame, which will be completed.
+    with_nonzero: If True, rows missing from df2 are filled with the previous row's values.
+    fill: Overrides with_nonzero with one of FILL_METHODS.
+
+    Returns:
+    df2: The completed DataFrame.
+    """
+    index = df2.index.append(df1.index[~df1.index.isin(df2.index)]).sort_values()
+    columns = df2.columns.append(df1.columns[~df1.columns.isin(df2.columns)])
+    return align_frame(df2, index=index, columns=columns, fill=fill or ('ffill' if with_nonzero else 'zero'))
+
+
+def count_cube(df, region, date, lineage, freq='M'):
+    """
+    Count the sequences by region, period and lineage in one pass over the rows.
+
+    The three columns are turned into integer codes once (the periods straight from
+    integer day numbers, without building Period objects) and the counts come from a
+    single np.bincount over the combined code, so every facet, the national total and
+    the percentages are slices of the same array instead of new filters and groupbys.
+    Rows without a date or lineage are left out (as groupby does); rows without a
+    region only count in the last slot, which belongs to the national total.
+
+    Parameters:
+    df: Metadata with one row per sequence.
+    region: Column with the region (UPA, macroregion, state, ...).
+    date: Datetime column with the collection date.
+    lineage: Column with the lineage or clade.
+    freq: Period of the time axis: 'M' (months), 'W' (epidemiological weeks), 'D' (days)
+          or a number of days.
+
+    Returns:
+    counts: int64 array of shape (len(regions) + 1, len(periods), len(lineages)).
+    regions: Sorted region names (counts[-1] holds the rows without a region).
+    periods: Sorted index of the periods with data.
+    lineages: Sorted lineage names.
+    """
+    days, valid = day_numbers(df[date])
+    region_codes, regions = pd.factorize(df[region], sort=True)
+    lineage_codes, lineages = pd.factorize(df[lineage], sort=True)
+    region_codes = np.where(region_codes >= 0, region_codes, len(regions))
+    valid = valid & (lineage_codes >= 0)
+
+    keys = _bin_keys(days[valid], freq, int(days[valid].min()) if valid.any() else 0)
+    period_codes, period_keys = pd.factorize(keys, sort=True)
+
+    shape = (len(regions) + 1, len(period_keys), len(lineages))
+    flat = (region_codes[valid] * shape[1] + period_codes) * shape[2] + lineage_codes[valid]
+    counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+    return counts, pd.Index(regions), _bin_labels(np.asarray(period_keys, dtype=np.int64), freq), pd.Index(lineages)
+
+
+def percentages(counts, periods, lineages):
+    """Turn a (periods x lineages) count slice into a DataFrame of row percentages (0 for empty periods)."""
+    totals = counts.sum(axis=1, keepdims=True)
+    freq = np.divide(counts * 100.0, totals, out=np.zeros(counts.shape), where=totals > 0)
+    return pd.DataFrame(freq, index=periods, columns=lineages)
+
+
+def day_numbers(dates):
+    """Days since 1970-01-01 of a datetime Series, without going through Periods (NaT gives -1 in 'valid')."""
+    dates = pd.to_datetime(dates)
+    days = dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    return days, dates.notna().to_numpy()
+
+
+def daily_cube(df, region, date, lineage):
+    """
+    Count the sequences by region, day and lineage once, for roll_up to bin afterwards.
+
+    Same layout as count_cube, but the time axis is every day from the first to the last
+    collection date (a daily PeriodIndex), computed from integer day numbers.
+    """
+    days, valid = day_numbers(df[date])
+    region_codes, regions = pd.factorize(df[region], sort=True)
+    lineage_codes, lineages = pd.factorize(df[lineage], sort=True)
+    region_codes = np.where(region_codes >= 0, region_codes, len(regions))
+
+    valid = valid & (lineage_codes >= 0)
+    first_day = int(days[valid].min()) if valid.any() else 0
+    n_days = int(days[valid].max()) - first_day + 1 if valid.any() else 0
+    shape = (len(regions) + 1, n_days, len(lineages))
+    flat = (region_codes[valid] * shape[1] + days[valid] - first_day) * shape[2] + lineage_codes[valid]
+    counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+    periods = pd.PeriodIndex.from_ordinals(np.arange(first_day, first_day + n_days), freq='D')
+    return counts, pd.Index(regions), periods, pd.Index(lineages)
+
+
+def _day_number(value, end=False):
+    """Day number of a date, or of the first (last with end=True) day of a Period."""
+    if isinstance(value, pd.Period):
+        value = value.end_time if end else value.start_time
+    return int(np.datetime64(pd.Timestamp(value).date(), 'D').astype(np.int64))
+
+
+def _bin_keys(days, resolution, origin):
+    """Integer bin of every day number: the day itself, its month, its epiweek (Sunday it starts on) or its N-day window."""
+    if resolution == 'D':
+        return days
+    if resolution == 'M':
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    if resolution == 'W':
+        # 1970-01-01 was a Thursday, 4 days after a Sunday
+        return days - (days + 4) % 7
+    return origin + (days - origin) // int(resolution) * int(resolution)
+
+
+def _bin_labels(keys, resolution):
+    """Labels of the bins: monthly Periods, 'YYYY-Www' epiweeks, or daily Periods (the first day of each N-day window)."""
+    if resolution == 'M':
+        return pd.PeriodIndex.from_ordinals(keys, freq='M')
+    if resolution == 'W':
+        # An epidemiological week (Sunday to Saturday) belongs to the year of its Wednesday
+        wednesdays = pd.DatetimeIndex((keys + 3).astype('datetime64[D]'))
+        weeks = (wednesdays.dayofyear - 1) // 7 + 1
+        return pd.Index([f'{year}-W{week:02d}' for year, week in zip(wednesdays.year, weeks)])
+    return pd.PeriodIndex.from_ordinals(keys, freq='D')
+
+
+def roll_up(counts, days, resolution='M', start=None, end=None):
+    """
+    Bin daily counts into days, epidemiological weeks, months or N-day windows.
+
+    Only the compact daily counts are read: every day gets an integer bin and the days
+    of a bin, which are contiguous, are summed with one np.add.reduceat. All the bins
+    between 'start' and 'end' are returned, with zeros where there is no data, so
+    changing the resolution or the date range never goes back to the metadata.
+
+    Parameters:
+    counts: Array with the days on the second-to-last axis, e.g. daily_cube's counts.
+    days: Daily PeriodIndex of that axis (sorted, gaps allowed).
+    resolution: 'D', 'W' (epidemiological weeks, Sunday to Saturday), 'M' or a number of days.
+    start: First date kept (a date, or a Period meaning its first day); the first day with data by default.
+    end: Last date kept (a date, or a Period meaning its last day); the last day with data by default.
+
+    Returns:
+    binned: Array shaped like 'counts' with one entry per bin on the time axis.
+    labels: Index of the bins.
+    """
+    if days.freqstr != 'D':
+        raise ValueError(f"roll_up needs daily counts, not {days.freqstr!r} periods")
+    day_axis = np.asarray(days.asi8, dtype=np.int64)
+    first = _day_number(start) if start is not None else (int(day_axis[0]) if len(day_axis) else 0)
+    last = _day_number(end, end=True) if end is not None else (int(day_axis[-1]) if len(day_axis) else first - 1)
+
+    inside = (day_axis >= first) & (day_axis <= last)
+    counts = counts[..., inside, :]
+    keys = _bin_keys(day_axis[inside], resolution, first)
+    all_keys = np.unique(_bin_keys(np.arange(first, last + 1, dtype=np.int64), resolution, first))
+
+    binned = np.zeros(counts.shape[:-2] + (len(all_keys), counts.shape[-1]), dtype=counts.dtype)
+    if len(keys):
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        binned[..., np.searchsorted(all_keys, keys[starts]), :] = np.add.reduceat(counts, starts, axis=-2)
+    return binned, _bin_labels(all_keys, resolution)
+
+
+def stream_counts(path, date, lineage, chunksize=500_000, freq='M', **read_kwargs):
+    """
+    Count the sequences of a metadata file by period and lineage, reading it in chunks.
+
+    Only the date and lineage columns are parsed (the lineage as a categorical), and every
+    chunk is reduced to (period, lineage) counts with one np.unique over combined integer
+    codes before it is dropped, so memory grows with the number of distinct (period,
+    lineage) pairs instead of with the number of rows.
+
+    Parameters:
+    path: CSV/TSV metadata file.
+    date: Column with the collection date.
+    lineage: Column with the lineage or clade.
+    chunksize: Rows per chunk.
+    freq: 'M', 'W' or 'D' (a number of days gives windows counted from 1970-01-01).
+    read_kwargs: Extra arguments for pd.read_csv (e.g. sep).
+
+    Returns:
+    table: Counts by period (rows, only those with data) and lineage (columns), as
+           df.groupby([period, lineage]).size().unstack(fill_value=0) would give.
+    totals: Sequences per lineage whatever their date, as df[lineage].value_counts().
+    """
+    pairs = {}   # (period key, lineage) -> count
+    totals = {}  # lineage -> count, in order of first appearance
+    for chunk in iter_table(path, chunksize, usecols=[date, lineage], dtype={lineage: 'category'}, **read_kwargs):
+        names = chunk[lineage].cat.categories
+        codes = chunk[lineage].cat.codes.to_numpy().astype(np.int64)
+        for code, count in zip(*np.unique(codes[codes >= 0], return_counts=True)):
+            totals[names[code]] = totals.get(names[code], 0) + int(count)
+
+        days, valid = day_numbers(chunk[date])
+        valid = valid & (codes >= 0)
+        keys = _bin_keys(days[valid], freq, 0)
+        combined, counts = np.unique(keys * len(names) + codes[valid], return_counts=True)
+        for key, code, count in zip(combined // len(names), combined % len(names), counts):
+            pair = (int(key), names[code])
+            pairs[pair] = pairs.get(pair, 0) + int(count)
+
+    period_codes, period_keys = pd.factorize(np.array([key for key, _ in pairs], dtype=np.int64), sort=True)
+    lineage_codes, lineages = pd.factorize(pd.Index([name for _, name in pairs], dtype=object), sort=True)
+    table = np.zeros((len(period_keys), len(lineages)), dtype=np.int64)
+    table[period_codes, lineage_codes] = list(pairs.values())
+    table = pd.DataFrame(table, index=_bin_labels(np.asarray(period_keys, dtype=np.int64), freq), columns=pd.Index(lineages))
+    totals = pd.Series(totals, dtype=np.int64, name='count').sort_values(ascending=False, kind='stable')
+    return table, totals
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+
+def stratum_codes(*columns):
+    """
+    Combine one or more columns into a single integer stratum code per row.
+
+    Returns (codes, strata) where 'codes' holds a code in 0..len(strata)-1 for each row
+    (-1 when any of the columns is missing) and 'strata' is a DataFrame with the
+    column values of each code.
+    """
+    factorized = [pd.factorize(column, sort=True) for column in columns]
+    codes = np.zeros(len(columns[0]), dtype=np.int64)
+    missing = np.zeros(len(columns[0]), dtype=bool)
+    for column_codes, uniques in factorized:
+        codes = codes * len(uniques) + column_codes
+        missing |= column_codes < 0
+    codes[missing] = -1
+
+    # Renumber the combinations that actually occur as 0, 1, 2, ...
+    used, codes[~missing] = np.unique(codes[~missing], return_inverse=True)
+    strata = {}
+    for number in range(len(columns) - 1, -1, -1):
+        column_codes, uniques = factorized[number]
+        strata[number] = np.asarray(uniques)[used % len(uniques)]
+        used = used // len(uniques)
+    names = [getattr(column, 'name', None) or number for number, column in enumerate(columns)]
+    return codes, pd.DataFrame({names[number]: strata[number] for number in range(len(columns))})
+
+
+def stratified_sample(codes, n=None, fraction=None, min_per_stratum=0, cap=None, replace=False, seed=None):
+    """
+    Draw a sample from every stratum at once and return the positions of the chosen rows.
+
+    The rows are grouped a single time by their integer stratum code; the number drawn
+    from each stratum is decided with array arithmetic and the draws are made for all
+    strata together, so the cost does not depend on the number of strata.
+
+    The size of each stratum's sample is, in this order:
+    'n' rows, or round(fraction * stratum size) rows; at least 'min_per_stratum';
+    at most 'cap'; and, without replacement, at most the stratum size.
+
+    Parameters:
+    codes: Integer stratum code of each row (rows with a negative code are never drawn).
+    n: Fixed number of rows per stratum.
+    fraction: Fraction of each stratum to draw (used when 'n' is None).
+    min_per_stratum: Minimum number of rows per stratum.
+    cap: Maximum number of rows per stratum.
+    replace: Draw with replacement (a stratum can then give more rows than it has).
+    seed: Seed or numpy Generator; the whole sample depends on this single seed.
+
+    Returns:
+    Array of row positions, grouped by stratum.
+    """
+    codes = np.asarray(codes)
+    rng = np.random.default_rng(seed)
+    valid = np.flatnonzero(codes >= 0)
+    sizes = np.bincount(codes[valid]) if len(valid) else np.zeros(0, dtype=np.int64)
+
+    # Number of rows to draw from each stratum
+    if n is not None:
+        counts = np.full(len(sizes), n, dtype=np.int64)
+    elif fraction is not None:
+        counts = np.rint(sizes * fraction).astype(np.int64)
+    else:
+        counts = sizes.copy()
+    counts = np.maximum(counts, min_per_stratum)
+    if cap is not None:
+        counts = np.minimum(counts, cap)
+    if not replace:
+        counts = np.minimum(counts, sizes)
+    counts[sizes == 0] = 0
+
+    # Row positions sorted by stratum, and where each stratum starts in that order
+    starts = np.cumsum(sizes) - sizes
+    total = int(counts.sum())
+    strata = np.repeat(np.arange(len(counts)), counts)
+
+    if replace:
+        by_stratum = valid[np.argsort(codes[valid], kind='stable')]
+        picks = starts[strata] + (rng.random(total) * sizes[strata]).astype(np.int64)
+    else:
+        # Sorting on code + a random key in [0, 0.5) shuffles the rows inside every stratum
+        # at once; the first 'count' rows of each stratum are then a sample without replacement
+        by_stratum = valid[np.argsort(codes[valid] + 0.5 * rng.random(len(valid)))]
+        rank = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        picks = starts[strata] + rank
+    return by_stratum[picks]
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+
+def join_indices(left_keys, right_keys):
+    """
+    Match two key columns with a single hash pass and return the row pairs of the inner join.
+
+    Both key columns are factorized together (one hash table for all keys); the rows of
+    the right side are then grouped by code, so every left row finds its matches by
+    array arithmetic. Missing keys never match.
+
+    Parameters:
+    left_keys: Keys of the left table.
+    right_keys: Keys of the right table.
+
+    Returns:
+    left_rows: Positions of the joined left rows, in left order.
+    right_rows: Positions of the matching right rows (in right order for a repeated key).
+    left_matched: Boolean mask of the left rows that found at least one match.
+    right_matched: Boolean mask of the right rows used by at least one left row.
+    """
+    codes, uniques = pd.factorize(pd.concat([pd.Series(left_keys), pd.Series(right_keys)], ignore_index=True))
+    left_codes = codes[:len(left_keys)]
+    right_codes = codes[len(left_keys):]
+
+    # Right rows sorted by code, and where the rows of every code start in that order
+    # (one extra, empty, slot at the end is what the missing-key code -1 points to)
+    sizes = np.bincount(right_codes[right_codes >= 0], minlength=len(uniques) + 1)
+    starts = np.cumsum(sizes) - sizes
+    by_code = np.argsort(right_codes, kind='stable')[np.count_nonzero(right_codes < 0):]
+
+    # Every left row is repeated once per right row sharing its key
+    matches = sizes[left_codes]
+    left_rows = np.repeat(np.arange(len(left_keys)), matches)
+    rank = np.arange(len(left_rows)) - np.repeat(np.cumsum(matches) - matches, matches)
+    right_rows = by_code[starts[left_codes[left_rows]] + rank]
+
+    left_matched = matches > 0
+    right_matched = np.zeros(len(right_keys), dtype=bool)
+    right_matched[right_rows] = True
+    return left_rows, right_rows, left_matched, right_matched
+
+
+def take_joined(left, right, left_rows, right_rows, suffixes=('_x', '_y'), key=None):
+    """
+    Put the chosen left and right rows side by side, naming shared columns like pd.merge does.
+
+    'key' is the name of a key column present on both sides (as with pd.merge(on=key)):
+    it is kept once, from the left table, instead of being suffixed.
+    """
+    if key is not None:
+        right = right.drop(columns=key)
+    overlap = set(left.columns) & set(right.columns)
+    left = left.iloc[left_rows].reset_index(drop=True)
+    right = right.iloc[right_rows].reset_index(drop=True)
+    left.columns = [f'{column}{suffixes[0]}' if column in overlap else column for column in left.columns]
+    right.columns = [f'{column}{suffixes[1]}' if column in overlap else column for column in right.columns]
+    return pd.concat([left, right], axis=1)
+
+
+def hash_join(left, right, left_on, right_on, suffixes=('_x', '_y')):
+    """
+    Inner join of two DataFrames that also reports the rows left out on both sides.
+
+    One pass gives what pd.merge(how="inner") gives (same rows, order and dtypes) plus
+    the anti-joins that would otherwise need a second, left or outer, merge.
+
+    Parameters:
+    left: Left table (e.g. the study IDs).
+    right: Right table (e.g. the metadata spreadsheet).
+    left_on: Key column of the left table.
+    right_on: Key column of the right table.
+    suffixes: Added to the names of the columns present in both tables.
+
+    Returns:
+    matched: The joined rows.
+    left_unmatched: Rows of 'left' without a match.
+    right_unused: Rows of 'right' that no left row matched.
+    """
+    left_rows, right_rows, left_matched, right_matched = join_indices(left[left_on], right[right_on])
+    # Like pd.merge, a key column with the same name on both sides is kept once
+    matched = take_joined(left, right, left_rows, right_rows, suffixes, key=left_on if left_on == right_on else None)
+    return matched, left[~left_matched], right[~right_matched]
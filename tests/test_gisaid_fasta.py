@@ -0,0 +1,29 @@
+from gisaid_fasta import process_gisaid_fasta, extract_from_treated, treated_is_current
+
+
+def write_export(path, records):
+    with open(path, 'w') as fasta_file:
+        for isolate_id, sequence in records:
+            fasta_file.write(f'>A/Sample/{isolate_id}|{isolate_id}|A_/_H3N2|2024-01-01\n{sequence}\n')
+
+
+def test_treated_path_matches_single_pass_with_duplicate_ids(tmp_path):
+    # EPI_ISL_2 is in both exports, as happens when GISAID downloads overlap
+    first, second = tmp_path / 'first.fasta', tmp_path / 'second.fasta'
+    write_export(first, [('EPI_ISL_1', 'ACGT'), ('EPI_ISL_2', 'GGCC')])
+    write_export(second, [('EPI_ISL_2', 'GGCA'), ('EPI_ISL_3', 'TTAA')])
+    fasta_paths = [str(first), str(second)]
+    selected_ids = ['EPI_ISL_3', 'EPI_ISL_2']
+    headers = {'EPI_ISL_1': 'one', 'EPI_ISL_2': 'two', 'EPI_ISL_3': 'three'}
+    treated = str(tmp_path / 'treated.fasta')
+
+    direct = process_gisaid_fasta(fasta_paths, selected_ids, headers.get, tmp_path / 'selected.fasta',
+                                  tmp_path / 'renamed.fasta', treated_path=treated)
+    assert treated_is_current(treated, fasta_paths)
+    reused = extract_from_treated(treated, selected_ids, headers.get, tmp_path / 'selected_reused.fasta',
+                                  tmp_path / 'renamed_reused.fasta')
+
+    assert reused == direct
+    assert direct[1] == 4
+    assert (tmp_path / 'renamed_reused.fasta').read_bytes() == (tmp_path / 'renamed.fasta').read_bytes()
+    assert (tmp_path / 'selected_reused.fasta').read_bytes() == (tmp_path / 'selected.fasta').read_bytes()
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from table_join import hash_join
+
+
+def test_hash_join_matches_merge_on_shared_key_name():
+    left = pd.DataFrame({'id': ['b', 'a', 'c', 'b', None, 'e'], 'value': [1, 2, 3, 4, 5, 6]})
+    right = pd.DataFrame({'value': [10, 20, 30, 40], 'id': ['b', 'd', 'a', 'b']})
+
+    matched, left_unmatched, right_unused = hash_join(left, right, left_on='id', right_on='id')
+
+    pd.testing.assert_frame_equal(matched, pd.merge(left, right, on='id'))
+    pd.testing.assert_frame_equal(matched, pd.merge(left, right, left_on='id', right_on='id'))
+    assert left_unmatched['value'].tolist() == [3, 5, 6]
+    assert right_unused['id'].tolist() == ['d']
+
+
+def test_hash_join_matches_merge_on_different_key_names():
+    left = pd.DataFrame({'IDENTIFICADOR': ['x1', 'x2', 'x3'], 'note': ['p', 'q', 'r']})
+    right = pd.DataFrame({'hashcode': ['x3', 'x1', 'x1'], 'note': ['s', 't', 'u']})
+
+    matched, _, _ = hash_join(left, right, left_on='IDENTIFICADOR', right_on='hashcode')
+
+    pd.testing.assert_frame_equal(matched, pd.merge(left, right, left_on='IDENTIFICADOR', right_on='hashcode'))